@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the cprep pipeline on synthetic problems: times every stage
+(discover, compile, load_tests, generate, evaluate, then generate and
+evaluate again with everything cached) and measures the peak RSS of cprep
+itself during each stage. Results are written as JSON, so that two
+commits can be compared with --compare.
+
+Usage: python benchmarks/pipeline.py [--scenarios tiny_tests huge_tests ...]
+           [--scale 1.0] [--repeat 1] [--output results.json]
+           [--compare baseline.json]
+
+Every scenario runs in a fresh process, in a fresh problem directory,
+with the shared binary cache disabled. Needs g++.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT_DIR)
+
+from cprep.config import Config  # noqa: E402
+from cprep_cli import pipelines  # noqa: E402
+
+
+# N lines of "a b", with 0 <= a, b < V, seeded by the remaining arguments.
+GEN = r"""
+#include <cstdio>
+#include <cstdlib>
+#include <random>
+#include <string>
+int main(int argc, char** argv) {
+  long n = atol(argv[1]), v = atol(argv[2]);
+  std::string seed;
+  for (int i = 3; i < argc; ++i) seed += std::string(argv[i]) + " ";
+  std::mt19937_64 rng(std::hash<std::string>()(seed));
+  for (long i = 0; i < n; ++i)
+    printf("%ld %ld\n", (long)(rng() % v), (long)(rng() % v));
+}
+"""
+
+# Sums every line. The first pair goes to stderr, for stress-goal tests.
+SOL = r"""
+#include <cstdio>
+int main() {
+  long a, b; bool first = true;
+  while (scanf("%ld %ld", &a, &b) == 2) {
+    if (first) fprintf(stderr, "%ld %ld\n", a, b), first = false;
+    printf("%ld\n", %EXPR%);
+  }
+}
+"""
+
+SOL_FILE_IO = r"""
+#include <cstdio>
+int main() {
+  FILE* in = fopen("input.txt", "r"); FILE* out = fopen("output.txt", "w");
+  long a, b;
+  while (fscanf(in, "%ld %ld", &a, &b) == 2) fprintf(out, "%ld\n", a + b);
+}
+"""
+
+VALID = r"""
+#include <cstdio>
+int main() {
+  long a, b, n = 0;
+  while (scanf("%ld %ld", &a, &b) == 2) {
+    if (a < 0 || b < 0) return 1;
+    ++n;
+  }
+  return n > 0 ? 0 : 1;
+}
+"""
+
+CHECKER = r"""
+#include <cstdio>
+int main(int argc, char** argv) {
+  FILE* in = fopen(argv[1], "r"); FILE* out = fopen(argv[2], "r");
+  long a, b, x;
+  while (fscanf(in, "%ld %ld", &a, &b) == 2)
+    if (fscanf(out, "%ld", &x) != 1 || x != a + b) return 1;
+  return 0;
+}
+"""
+
+
+def _sol(expr: str = "a + b"):
+    return SOL.replace('%EXPR%', expr)
+
+
+def _tiny_tests(scale: float):
+    tests = [f"./gen 1 100 {i}" for i in range(int(500 * scale))]
+    return {
+        'gen.cpp': GEN, 'valid.cpp': VALID,
+        'sol.cpp': _sol(), 'sol_other.cpp': _sol("b + a"),
+    }, tests, {}
+
+
+def _huge_tests(scale: float):
+    tests = [f"./gen {int(1000000 * scale)} 1000000000 {i}" for i in range(3)]
+    return {
+        'gen.cpp': GEN, 'valid.cpp': VALID,
+        'sol.cpp': _sol(), 'sol_other.cpp': _sol("b + a"),
+    }, tests, {}
+
+
+def _many_solutions(scale: float):
+    files = {'gen.cpp': GEN, 'valid.cpp': VALID, 'sol.cpp': _sol()}
+    for i in range(int(16 * scale)):
+        # Different sources, so that all of them get compiled.
+        files[f'sol_{i:02}.cpp'] = _sol(f"a + b + {i} - {i}")
+    tests = [f"./gen 10 1000 {i}" for i in range(10)]
+    return files, tests, {}
+
+
+def _stress(scale: float):
+    tests = [f"./gen 1 50 {i}" for i in range(4)] + [
+        # Fails with probability 1/2500, so most salts get tried.
+        f"./gen 1 50 #! stress-fail sol_wa {int(200 * scale)}",
+        f"./gen 1 1000 #! stress-goal @0 {int(100 * scale)}",
+        f"./gen 1 1000 #! stress-goal @0 {int(100 * scale)} restarts",
+    ]
+    return {
+        'gen.cpp': GEN, 'valid.cpp': VALID, 'sol.cpp': _sol(),
+        'sol_wa.cpp': _sol("a == 7 && b == 7 ? 0 : a + b"),
+    }, tests, {}
+
+
+def _file_io(scale: float):
+    tests = [f"./gen 100 1000 {i}" for i in range(int(200 * scale))]
+    return {
+        'gen.cpp': GEN, 'valid.cpp': VALID, 'checker.cpp': CHECKER,
+        'sol.cpp': SOL_FILE_IO, 'sol_stdio.cpp': _sol(),
+    }, tests, {'problem': {'input_file': 'input.txt', 'output_file': 'output.txt'}}
+
+
+SCENARIOS = {
+    'tiny_tests': _tiny_tests,
+    'huge_tests': _huge_tests,
+    'many_solutions': _many_solutions,
+    'stress': _stress,
+    'file_io': _file_io,
+}
+
+
+def _merge(d1: dict, d2: dict):
+    for k, v in d2.items():
+        if isinstance(v, dict) and isinstance(d1.get(k), dict):
+            _merge(d1[k], v)
+        else:
+            d1[k] = v
+
+
+def _load_config(overrides: dict):
+    with open(os.path.join(ROOT_DIR, 'cprep_cli', 'config.yaml')) as f:
+        cfg = yaml.load(f, Loader=yaml.FullLoader)
+    _merge(cfg, {
+        'problem': {'name': 'bench'},
+        # Compilation should be timed cold.
+        'compilation': {'cache_dir': None},
+    })
+    _merge(cfg, overrides)
+    return Config(**cfg)
+
+
+def _peak_rss_kb():
+    """Peak RSS of this process since the last `_reset_peak_rss`."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _reset_peak_rss():
+    # Linux only; elsewhere, peaks are those since the process started.
+    with contextlib.suppress(OSError):
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+
+
+def _cpu_seconds(who: int):
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_scenario(name: str, scale: float):
+    """Builds the problem and times the stages. Runs in its own process."""
+    files, tests, overrides = SCENARIOS[name](scale)
+    work_dir = tempfile.mkdtemp(prefix=f'cprep-bench-{name}-')
+    for file_name, source in files.items():
+        with open(os.path.join(work_dir, file_name), 'w') as f:
+            f.write(source)
+    with open(os.path.join(work_dir, 'tests.sh'), 'w') as f:
+        f.write('\n'.join(tests) + '\n')
+    os.chdir(work_dir)
+    cfg = _load_config(overrides)
+
+    stages = {}
+
+    @contextlib.contextmanager
+    def stage(stage_name: str):
+        _reset_peak_rss()
+        tick = time.perf_counter()
+        cpu_self = _cpu_seconds(resource.RUSAGE_SELF)
+        cpu_children = _cpu_seconds(resource.RUSAGE_CHILDREN)
+        yield
+        stages[stage_name] = {
+            'wall_s': time.perf_counter() - tick,
+            # cprep itself, as opposed to the processes it ran.
+            'cpu_self_s': _cpu_seconds(resource.RUSAGE_SELF) - cpu_self,
+            'cpu_children_s': _cpu_seconds(resource.RUSAGE_CHILDREN) - cpu_children,
+            'peak_rss_kb': _peak_rss_kb(),
+        }
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        with stage('discover'):
+            problem_files = pipelines.discover_files(cfg)
+        with pipelines.create_worker_pool(cfg) as pool:
+            with stage('compile'):
+                pipelines.compile_files(problem_files, cfg, pool)
+            with stage('load_tests'):
+                test_cases = pipelines.load_tests(problem_files, cfg)
+            with stage('generate'):
+                pipelines.generate_test_cases(test_cases, problem_files, cfg, pool)
+            with stage('evaluate'):
+                pipelines.compute_evaluation_results(
+                    problem_files, test_cases, cfg, pool, use_cache=False)
+            # Nothing changed, so these only hit the caches.
+            test_cases = pipelines.load_tests(problem_files, cfg)
+            with stage('generate_cached'):
+                pipelines.generate_test_cases(test_cases, problem_files, cfg, pool)
+            with stage('evaluate_cached'):
+                pipelines.compute_evaluation_results(
+                    problem_files, test_cases, cfg, pool)
+
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return {
+        'num_tests': len(test_cases),
+        'num_solutions': len(problem_files.solutions),
+        'stages': stages,
+        'wall_s': sum(s['wall_s'] for s in stages.values()),
+        'peak_rss_kb': max(s['peak_rss_kb'] for s in stages.values()),
+    }
+
+
+def _best_of(runs: list):
+    """Fastest time and highest peak RSS of each stage, over the runs."""
+    best = dict(runs[0], stages={})
+    for stage_name in runs[0]['stages']:
+        samples = [run['stages'][stage_name] for run in runs]
+        best['stages'][stage_name] = {
+            key: (max if key == 'peak_rss_kb' else min)(s[key] for s in samples)
+            for key in samples[0]}
+    best['wall_s'] = min(run['wall_s'] for run in runs)
+    best['peak_rss_kb'] = max(run['peak_rss_kb'] for run in runs)
+    return best
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+            capture_output=True, check=True).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_results(results: dict, baseline: dict = None):
+    for name, res in results['scenarios'].items():
+        base = (baseline or {}).get('scenarios', {}).get(name)
+        print(f"{name} ({res['num_tests']} tests, {res['num_solutions']} solutions)")
+        for stage_name, s in list(res['stages'].items()) + [('total', res)]:
+            line = f"  {stage_name:<16} {s['wall_s']:8.3f} s {s['peak_rss_kb'] / 1024:8.1f} MB"
+            b = base and (base if stage_name == 'total' else base['stages'].get(stage_name))
+            if b:
+                line += (f"   (was {b['wall_s']:.3f} s, x{s['wall_s'] / max(b['wall_s'], 1e-9):.2f}; "
+                         f"{b['peak_rss_kb'] / 1024:.1f} MB)")
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS),
+                        default=list(SCENARIOS))
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="Multiplies the number and size of tests")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="Runs of every scenario; the best times are kept")
+    parser.add_argument("--output", help="Writes the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results to compare against")
+    parser.add_argument("--run-scenario", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scenario:
+        json.dump(run_scenario(args.run_scenario, args.scale), sys.stdout)
+        return
+
+    results = {
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'scale': args.scale,
+        'scenarios': {},
+    }
+    for name in args.scenarios:
+        runs = []
+        for _ in range(args.repeat):
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__),
+                 '--run-scenario', name, '--scale', str(args.scale)],
+                stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, check=True)
+            runs.append(json.loads(out.stdout))
+        results['scenarios'][name] = _best_of(runs)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    _print_results(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for process spawning: runs per second of a trivial
+binary, through the old shell-based `subprocess.run` path and through
+`cprep.execution.execute`.
+
+Usage: python benchmarks/spawn.py [--binary /bin/true] [--runs 2000]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from cprep.execution import DEVNULL, PIPE, execute  # noqa: E402
+
+
+def bench(name: str, fn, runs: int):
+    fn()  # Warmup.
+    tick = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    elapsed = time.perf_counter() - tick
+    print(f"{name:<36} {runs / elapsed:10.1f} runs/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--binary", default="/bin/true")
+    parser.add_argument("--runs", type=int, default=2000)
+    args = parser.parse_args()
+    binary = os.path.abspath(args.binary)
+
+    bench("subprocess.run(shell=True)", lambda: subprocess.run(
+        [binary], shell=True, capture_output=True, input=b''), args.runs)
+    bench("subprocess.run", lambda: subprocess.run(
+        [binary], capture_output=True, input=b''), args.runs)
+    bench("execute (posix_spawn, DEVNULL)", lambda: execute(
+        [binary], stdin=DEVNULL, stdout=DEVNULL, stderr=DEVNULL), args.runs)
+    bench("execute (posix_spawn, PIPE)", lambda: execute(
+        [binary], stdin=DEVNULL, stdout=PIPE, stderr=DEVNULL), args.runs)
+
+
+if __name__ == "__main__":
+    main()
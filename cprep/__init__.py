@@ -1 +1 @@
-from . import base, config, compilation, evaluation, files, generation, tests
\ No newline at end of file
+from . import base, bench, cache, comparison, config, compilation, evaluation, execution, files, fingerprint, generation, sandbox, storage, stress, tests, tracing, workers
\ No newline at end of file
@@ -1,6 +1,9 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import os
-from typing import List
+from typing import List, Optional
+
+from .manifest import file_digest
+from .sandbox import remove_scratch_dir
 
 
 @dataclass
@@ -8,11 +11,29 @@ class File:
     src_path: str
     kind: str
     exec_path: str = None
+    run_args: List[str] = None
+    _exec_digest: str = field(default=None, repr=False, compare=False)
 
     @property
     def compiled(self):
         return self.exec_path is not None
 
+    def run_command(self, exec_path: str = None):
+        """Returns the argv that runs the executable, from the
+        `run` template of its language."""
+        assert self.compiled, f"File '{self.src_path}' not compiled"
+        exec_path = exec_path or self.exec_path
+        if not self.run_args:
+            return [exec_path]
+        return [arg.format(exec_path=exec_path) for arg in self.run_args]
+
+    @property
+    def exec_digest(self):
+        assert self.compiled, f"File '{self.src_path}' not compiled"
+        if self._exec_digest is None:
+            self._exec_digest = file_digest(self.exec_path)
+        return self._exec_digest
+
     @property
     def ext(self):
         return os.path.splitext(self.src_path)[-1].lower()[1:]
@@ -33,17 +54,58 @@ class EvalResult:
     info: str = None
 
 
-@dataclass
 class TestCase:
-    args: List[str]
-    special_args: List[str]
-    input_text: str
-    answer_text: str
-    group_idx: int
-    idx: int
-    generator_name: str
-    info: str
+    """A test, as described by a line of the tests script.
+
+    The input and answer live in their files, and are only read when
+    needed. Freshly generated tests live in scratch files until stored."""
+
+    __slots__ = (
+        'args', 'special_args', 'group_idx', 'idx', 'generator_name', 'info',
+        'input_path', 'answer_path', 'scratch_input_path', 'scratch_answer_path')
+
+    def __init__(
+            self, args: List[str], special_args: Optional[List[str]],
+            group_idx: int, idx: int, generator_name: str,
+            info: Optional[str] = None,
+            input_path: Optional[str] = None,
+            answer_path: Optional[str] = None):
+        self.args = args
+        self.special_args = special_args
+        self.group_idx = group_idx
+        self.idx = idx
+        self.generator_name = generator_name
+        self.info = info
+        self.input_path = input_path
+        self.answer_path = answer_path
+        self.scratch_input_path = None
+        self.scratch_answer_path = None
+
+    def __repr__(self):
+        return (f"TestCase(idx={self.idx}, generator_name={self.generator_name!r}, "
+                f"args={self.args!r}, special_args={self.special_args!r})")
+
+    @staticmethod
+    def _exists(path: Optional[str]):
+        return bool(path) and os.path.isfile(path) and os.path.getsize(path) > 0
+
+    @property
+    def input(self) -> Optional[str]:
+        """Path of the input: the scratch file if freshly generated,
+        or the stored test file otherwise."""
+        return self.scratch_input_path or self.input_path
+
+    @property
+    def answer(self) -> Optional[str]:
+        return self.scratch_answer_path or self.answer_path
 
     @property
     def generated(self):
-        return self.input_text and self.answer_text
+        return self._exists(self.input) and self._exists(self.answer)
+
+    def discard_scratch(self):
+        """Removes the scratch files of a freshly generated test."""
+        for path in {self.scratch_input_path, self.scratch_answer_path}:
+            if path:
+                remove_scratch_dir(os.path.dirname(path))
+        self.scratch_input_path = self.scratch_answer_path = None
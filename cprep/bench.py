@@ -0,0 +1,108 @@
+"""
+Benchmarking of solutions: every solution runs several times on a test,
+after some warmup runs, and the timings are summarized with statistics
+that hold up to noise (median, percentiles, and a confidence interval
+for the median that makes no assumption on the distribution).
+
+Times are CPU times (user + sys), the same as for the time limit.
+"""
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+import math
+import statistics
+
+from . import evaluation
+from .base import File
+from .config import ProblemConfig
+
+
+# Scales the MAD to the standard deviation, for normal distributions.
+MAD_SCALE = 0.6745
+
+
+@dataclass
+class BenchResult:
+    verdict: str
+    info: str = None
+    times: List[float] = field(default_factory=list)  # Kept runs (ms)
+    num_outliers: int = 0
+    median: float = None
+    min: float = None
+    p95: float = None
+    stddev: float = None
+    ci: Tuple[float, float] = None  # Confidence interval of the median
+
+    def crosses(self, time_limit_ms: float):
+        """Whether the time limit is inside the confidence interval,
+        i.e. the runs can't tell whether the solution fits in it."""
+        return self.ci is not None and self.ci[0] <= time_limit_ms <= self.ci[1]
+
+
+def _binomial(n: int, k: int):
+    return math.factorial(n) // (math.factorial(k) * math.factorial(n - k))
+
+
+def _percentile(sorted_times: List[float], q: float):
+    pos = (len(sorted_times) - 1) * q
+    lo, hi = math.floor(pos), math.ceil(pos)
+    return sorted_times[lo] + (sorted_times[hi] - sorted_times[lo]) * (pos - lo)
+
+
+def _median_ci(sorted_times: List[float], confidence: float):
+    """Interval [x_(k), x_(n+1-k)] between order statistics, with the
+    largest k that still covers the median with the given confidence.
+    Few runs give the whole range."""
+    n = len(sorted_times)
+    k, tail = 1, 0.5 ** n  # tail = P(Binomial(n, 1/2) < k)
+    while k < (n + 1) // 2:
+        next_tail = tail + _binomial(n, k) * 0.5 ** n
+        if 1 - 2 * next_tail < confidence:
+            break
+        k, tail = k + 1, next_tail
+    return sorted_times[k - 1], sorted_times[n - k]
+
+
+def _reject_outliers(times: List[float], threshold: float):
+    """Drops the runs whose modified z-score (distance to the median,
+    in scaled MADs) is above the threshold."""
+    median = statistics.median(times)
+    mad = statistics.median(abs(t - median) for t in times)
+    if not mad:
+        return times
+    return [t for t in times if MAD_SCALE * abs(t - median) / mad <= threshold]
+
+
+def summarize(times: List[float], outlier_threshold: float,
+              confidence: float) -> BenchResult:
+    kept = sorted(_reject_outliers(times, outlier_threshold))
+    return BenchResult(
+        verdict='AC',
+        times=kept,
+        num_outliers=len(times) - len(kept),
+        median=statistics.median(kept),
+        min=kept[0],
+        p95=_percentile(kept, 0.95),
+        stddev=statistics.stdev(kept) if len(kept) > 1 else 0.,
+        ci=_median_ci(kept, confidence))
+
+
+def run_benchmark(
+        sol_file: File, input, cfg: ProblemConfig,
+        num_runs: int, num_warmup_runs: int,
+        timeout_ms: float, outlier_threshold: float, confidence: float,
+        cpu: Optional[int] = None) -> BenchResult:
+    """Runs the solution `num_warmup_runs + num_runs` times, one after
+    the other, and summarizes the timed runs. Outputs are not checked.
+    Stops at the first run that fails (RE, OLE, or killed after
+    `timeout_ms`), and returns its verdict."""
+    assert num_runs > 0, "Benchmarking needs at least one run"
+    times = []
+    for i in range(num_warmup_runs + num_runs):
+        res = evaluation.run_solution(
+            sol_file, input, cfg, timeout_ms=timeout_ms, run_twice=False,
+            output_handler=lambda output_path: None, cpu=cpu)
+        if res.verdict != 'AC':
+            return BenchResult(verdict=res.verdict, info=res.info)
+        if i >= num_warmup_runs:
+            times.append(res.time_exec_ms)
+    return summarize(times, outlier_threshold, confidence)
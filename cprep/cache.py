@@ -0,0 +1,224 @@
+import functools
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import threading
+from typing import Callable, List
+
+from .base import EvalResult
+
+
+@functools.lru_cache(maxsize=None)
+def compiler_identity(compiler: str):
+    """Returns a string identifying the compiler binary, so that upgrading
+    it invalidates cached binaries."""
+    path = shutil.which(compiler) or compiler
+    identity = [os.path.realpath(path)]
+    try:
+        stat = os.stat(path)
+        identity += [str(stat.st_size), str(stat.st_mtime_ns)]
+    except OSError:
+        pass
+    try:
+        version = subprocess.run(
+            [path, '--version'], capture_output=True, timeout=10).stdout
+        identity.append(version.decode('utf-8', errors='replace'))
+    except (OSError, subprocess.SubprocessError):
+        pass
+    return '\n'.join(identity)
+
+
+def compile_key(src_path: str, compile_args: List[str]):
+    """Content-addressed key of a compilation: the source bytes,
+    the compile command template and the compiler identity."""
+    h = hashlib.sha256()
+    with open(src_path, 'rb') as stream:
+        h.update(stream.read())
+    h.update(b'\0')
+    h.update('\0'.join(compile_args).encode('utf-8'))
+    h.update(b'\0')
+    if compile_args:
+        h.update(compiler_identity(compile_args[0]).encode('utf-8'))
+    return h.hexdigest()
+
+
+def dependency_key(key: str, dep_paths: List[str]):
+    """Extends a compile key with the contents of the files the source
+    includes (as listed by the compiler), so that editing a header
+    invalidates the binaries built with it."""
+    h = hashlib.sha256(key.encode('utf-8'))
+    for path in dep_paths:
+        h.update(b'\0' + path.encode('utf-8') + b'\0')
+        try:
+            with open(path, 'rb') as stream:
+                h.update(hashlib.sha256(stream.read()).digest())
+        except OSError:
+            h.update(b'missing')
+    return h.hexdigest()
+
+
+class BinaryCache:
+    """Global store of compiled binaries, shared between problems.
+
+    Binaries are stored by compile key (including the included files, see
+    `dependency_key`), and evicted in least-recently-used order when the
+    store grows over `max_size_mb`. The files included by each source are
+    stored by its plain compile key, to find the binary in the first place."""
+
+    def __init__(self, cache_dir: str, max_size_mb: float):
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.max_size = max_size_mb * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _object_path(self, key: str):
+        return os.path.join(self.cache_dir, 'objects', key[:2], key)
+
+    def _deps_path(self, key: str):
+        return os.path.join(self.cache_dir, 'deps', key[:2], f"{key}.json")
+
+    @property
+    def _stats_path(self):
+        return os.path.join(self.cache_dir, 'stats.json')
+
+    def get(self, key: str, output_path: str):
+        """Copies the binary with the given key to `output_path`.
+        Returns False if it is not in the store."""
+        object_path = self._object_path(key)
+        try:
+            shutil.copy2(object_path, output_path)
+            # Mark as recently used.
+            os.utime(object_path)
+        except OSError:
+            self.count_miss()
+            return False
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def count_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def put(self, key: str, exec_path: str):
+        object_path = self._object_path(key)
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        tmp_path = f"{object_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copy2(exec_path, tmp_path)
+        os.replace(tmp_path, object_path)
+        os.utime(object_path)
+
+    def get_deps(self, key: str):
+        """Returns the files included by the source with the given compile
+        key (see `dependency_key`), or None if it was never compiled."""
+        try:
+            with open(self._deps_path(key), 'r') as stream:
+                return json.load(stream)
+        except (OSError, ValueError):
+            return None
+
+    def put_deps(self, key: str, dep_paths: List[str]):
+        deps_path = self._deps_path(key)
+        os.makedirs(os.path.dirname(deps_path), exist_ok=True)
+        tmp_path = f"{deps_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as stream:
+            json.dump(dep_paths, stream)
+        os.replace(tmp_path, deps_path)
+
+    def evict(self):
+        """Removes least recently used binaries until the store fits."""
+        objects = []
+        for root, _, names in os.walk(os.path.join(self.cache_dir, 'objects')):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                objects.append((stat.st_mtime, stat.st_size, path))
+        total_size = sum(size for _, size, _ in objects)
+        for _, size, path in sorted(objects):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_size -= size
+        return total_size
+
+    def flush_stats(self):
+        """Adds the hits/misses of this session to the persistent
+        statistics and returns the totals."""
+        with self._lock:
+            stats = {'hits': 0, 'misses': 0}
+            if os.path.exists(self._stats_path):
+                with open(self._stats_path, 'r') as stream:
+                    stats.update(json.load(stream))
+            stats['hits'] += self.hits
+            stats['misses'] += self.misses
+            self.hits = self.misses = 0
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{self._stats_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as stream:
+                json.dump(stats, stream)
+            os.replace(tmp_path, self._stats_path)
+        return stats
+
+
+class VerdictCache:
+    """Persistent store of evaluation results, keyed on everything
+    that can influence them.
+
+    Each result also records the digests it depends on, so that results
+    of binaries and tests that are gone can be pruned."""
+
+    FIELDS = ['verdict', 'time_exec_ms', 'memory_used', 'info']
+    # Verdicts that depend on timing or on the machine, not only on
+    # the key: they are rerun every time.
+    UNCACHED_VERDICTS = ['TLE', 'MLE', 'FAIL']
+    # Bumped when the way results are measured changes, which
+    # invalidates the stored ones.
+    VERSION = 2
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, 'r') as stream:
+                self.entries = json.load(stream)
+
+    @classmethod
+    def key(cls, *parts):
+        return hashlib.sha256('\0'.join(
+            str(part) for part in (cls.VERSION,) + parts).encode('utf-8')).hexdigest()
+
+    def get(self, key: str):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        return EvalResult(**{k: entry[k] for k in self.FIELDS})
+
+    def set(self, key: str, res: EvalResult, deps: dict):
+        """Stores the result, along with the digests it depends on
+        (see `prune`)."""
+        if res.verdict in self.UNCACHED_VERDICTS:
+            return
+        self.entries[key] = {
+            **{k: getattr(res, k) for k in self.FIELDS}, 'deps': deps}
+
+    def prune(self, is_live: Callable[[dict], bool]):
+        """Drops the results whose dependencies no longer exist."""
+        self.entries = {
+            key: entry for key, entry in self.entries.items()
+            if 'deps' in entry and is_live(entry['deps'])}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as stream:
+            json.dump(self.entries, stream)
+        os.replace(tmp_path, self.path)
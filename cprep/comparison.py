@@ -0,0 +1,171 @@
+"""
+Streaming output comparison.
+
+Both sides are read in fixed-size chunks, so memory usage doesn't depend
+on the size of the output.
+"""
+from typing import BinaryIO, Iterable, Iterator, Optional
+import math
+import re
+
+
+CHUNK_SIZE = 1 << 20
+MODES = ['lines', 'tokens', 'float']
+
+# Same as the whitespace stripped by `bytes.rstrip()`, without line breaks.
+_LINE_WS = b' \t\x0b\x0c'
+_TRAILING_WS = re.compile(rb'[ \t\x0b\x0c]\n')
+
+
+def _chunks(stream: BinaryIO):
+    return iter(lambda: stream.read(CHUNK_SIZE), b'')
+
+
+def normalized_lines(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Yields the content of the chunks, with trailing whitespace removed
+    from every line and every line terminated by '\\n'. Used both for
+    comparing outputs and for storing tests."""
+    held = b''       # Trailing whitespace of the current line, so far.
+    in_line = False  # Whether the current line is unterminated.
+    prev_cr = False
+    for chunk in chunks:
+        if prev_cr and chunk.startswith(b'\n'):
+            # Second half of a '\r\n' split between chunks.
+            chunk = chunk[1:]
+        prev_cr = chunk.endswith(b'\r')
+        if (not held and b'\r' not in chunk and not _TRAILING_WS.search(chunk)
+                and chunk[-1:] not in _LINE_WS):
+            # Nothing to strip: most chunks, which are then not split
+            # into lines at all.
+            if chunk:
+                yield chunk
+                in_line = not chunk.endswith(b'\n')
+            continue
+        out = []
+        for line in chunk.splitlines(keepends=True):
+            body = line.rstrip(b'\r\n')
+            stripped = body.rstrip(_LINE_WS)
+            if stripped:
+                out += [held, stripped]
+                held = b''
+            held += body[len(stripped):]
+            in_line = True
+            if len(body) != len(line):
+                out.append(b'\n')
+                held, in_line = b'', False
+        yield b''.join(out)
+    if in_line:
+        yield b'\n'
+
+
+def _mismatch_idx(a: bytes, b: bytes):
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if a[lo:mid + 1] == b[lo:mid + 1]:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def _next_nonempty(chunks: Iterator[bytes]):
+    for chunk in chunks:
+        if chunk:
+            return chunk
+    return None
+
+
+def _compare_lines(output: BinaryIO, answer: BinaryIO) -> Optional[str]:
+    out_chunks = normalized_lines(_chunks(output))
+    ans_chunks = normalized_lines(_chunks(answer))
+    out_buf, ans_buf = b'', b''
+    line, col = 1, 1
+    while True:
+        if not out_buf:
+            out_buf = _next_nonempty(out_chunks)
+        if not ans_buf:
+            ans_buf = _next_nonempty(ans_chunks)
+        if out_buf is None or ans_buf is None:
+            break
+        n = min(len(out_buf), len(ans_buf))
+        match = out_buf[:n] == ans_buf[:n]
+        if not match:
+            n = _mismatch_idx(out_buf, ans_buf)
+        common = out_buf[:n]
+        newlines = common.count(b'\n')
+        line += newlines
+        col = (n - common.rfind(b'\n')) if newlines else col + n
+        if not match:
+            return f"Line {line}, column {col}: output differs from answer"
+        out_buf, ans_buf = out_buf[n:], ans_buf[n:]
+
+    if out_buf is None and ans_buf is None:
+        return None
+    if out_buf is None:
+        return f"Line {line}, column {col}: output ended early"
+    return f"Line {line}, column {col}: output is too long"
+
+
+def tokens(stream: BinaryIO) -> Iterator[bytes]:
+    """Yields the whitespace-separated tokens of the stream."""
+    carry = b''
+    for chunk in _chunks(stream):
+        chunk_tokens = (carry + chunk).split()
+        # The last token might continue in the next chunk.
+        carry = (chunk_tokens.pop()
+                 if chunk_tokens and not chunk[-1:].isspace() else b'')
+        yield from chunk_tokens
+    if carry:
+        yield carry
+
+
+def _tokens_equal(out_token: bytes, ans_token: bytes, epsilon: Optional[float]):
+    if out_token == ans_token:
+        return True
+    if epsilon is None:
+        return False
+    try:
+        out_value, ans_value = float(out_token), float(ans_token)
+    except ValueError:
+        return False
+    if math.isnan(out_value) or math.isnan(ans_value):
+        return False
+    # Absolute or relative error.
+    return abs(out_value - ans_value) <= epsilon * max(1., abs(ans_value))
+
+
+def _compare_tokens(output: BinaryIO, answer: BinaryIO,
+                    epsilon: Optional[float]) -> Optional[str]:
+    out_tokens, ans_tokens = tokens(output), tokens(answer)
+    idx = 0
+    while True:
+        idx += 1
+        out_token, ans_token = next(out_tokens, None), next(ans_tokens, None)
+        if out_token is None and ans_token is None:
+            return None
+        if out_token is None:
+            return f"Token {idx}: output ended early"
+        if ans_token is None:
+            return f"Token {idx}: output is too long"
+        if not _tokens_equal(out_token, ans_token, epsilon):
+            return (f"Token {idx}: expected '{ans_token[:32].decode(errors='replace')}', "
+                    f"found '{out_token[:32].decode(errors='replace')}'")
+
+
+def compare_output(output: BinaryIO, answer: BinaryIO,
+                   mode: str = 'lines', epsilon: float = 1e-6) -> Optional[str]:
+    """Compares the output with the answer. Returns None if they match,
+    or a description of the first mismatch otherwise.
+
+    Modes:
+     - 'lines': lines must match, ignoring trailing whitespace
+     - 'tokens': whitespace-separated tokens must match
+     - 'float': like 'tokens', but numbers may differ by `epsilon`
+       (absolute or relative error)
+    """
+    assert mode in MODES, f"Unknown comparison mode: '{mode}'"
+    if mode == 'lines':
+        return _compare_lines(output, answer)
+    return _compare_tokens(
+        output, answer, epsilon=(epsilon if mode == 'float' else None))
@@ -1,54 +1,123 @@
-from typing import List
+from typing import List, Optional
 import subprocess 
 import os 
+import json
+import re
 from loguru import logger 
 import time
-import hashlib
+import threading
 
 from cprep.base import File, EvalResult
+from cprep.cache import BinaryCache, compile_key, dependency_key
+from cprep import tracing
 
 
-def compile(f: File, compile_args: List[str], output_dir: str):
-    os.makedirs(output_dir, exist_ok=True)
-    output_path = os.path.join(output_dir, f.name)
-    cache_path = os.path.join(output_dir, 'cache.txt')
-    compile_args = [
-        arg.format(exec_path=output_path, src_path=f.src_path)
-        for arg in compile_args]
+_cache_lock = threading.Lock()
 
+
+def _read_cache(cache_path: str):
     cache = {}
     if os.path.exists(cache_path):
         with open(cache_path, 'r') as stream:
             for line in stream:
-                if line:
+                if line.strip():
                     k, v = line.strip().split()
                     cache[k] = v
-    assert os.path.exists(f.src_path), f"File '{f.src_path}' does not exist."
-    with open(f.src_path, 'r') as stream:
-        sha = hashlib.sha256(stream.read().encode('utf-8')).hexdigest()
-    if cache.get(f.name) == sha and os.path.isfile(output_path):
-        f.exec_path = output_path
-        return True, True
+    return cache
 
-    try:
-        subprocess.run(compile_args, check=True, capture_output=True)
-        f.exec_path = output_path
-        cache[f.name] = sha 
-        with open(cache_path, 'w') as stream:
-            for k, v in cache.items(): 
+
+def _update_cache(cache_path: str, name: str, key: str):
+    # Compilations may finish concurrently, so the read-modify-write
+    # is serialized and the file is replaced atomically.
+    with _cache_lock:
+        cache = _read_cache(cache_path)
+        cache[name] = key
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as stream:
+            for k, v in cache.items():
                 stream.write(f"{k} {v}\n")
-        return True, False
-    except subprocess.CalledProcessError as ex:
-        return False, False 
+        os.replace(tmp_path, cache_path)
+
 
+def _write_deps(deps_path: str, deps: List[str]):
+    tmp_path = f"{deps_path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w') as stream:
+        json.dump(deps, stream)
+    os.replace(tmp_path, deps_path)
 
-def run(f: File, args: List[str]):
-    assert f.compiled, f"File '{f.src_path}' not compiled"
-    output = subprocess.run([f.exec_path] + args, check=True, capture_output=True)
-    return output.stdout
 
+# Compilers that can list the files a source includes (-MMD).
+_DEPFILE_COMPILER = re.compile(r'(^|-)(gcc|g\+\+|cc|c\+\+|clang|clang\+\+)(-[\d.]+)?$')
 
 
+def _read_depfile(path: str, src_path: str):
+    """Returns the dependencies listed in a Makefile rule written by the
+    compiler, except for the source itself."""
+    with open(path, 'r') as stream:
+        text = stream.read().replace('\\\n', ' ')
+    _, _, deps = text.partition(': ')
+    deps = [dep.replace('\\ ', ' ') for dep in re.split(r'(?<!\\)\s+', deps) if dep]
+    return [dep for dep in deps if dep != src_path]
 
 
+def _read_deps(deps_path: str):
+    try:
+        with open(deps_path, 'r') as stream:
+            return json.load(stream)
+    except (OSError, ValueError):
+        return None
+
+
+def compile(f: File, compile_args: List[str], output_dir: str,
+            cache: Optional[BinaryCache] = None):
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir, f.name)
+    cache_path = os.path.join(output_dir, 'cache.txt')
+    # Local headers included by the last compilation, which are part
+    # of the key (system headers come with the compiler identity).
+    deps_path = f"{output_path}.deps"
+
+    assert os.path.exists(f.src_path), f"File '{f.src_path}' does not exist."
+    src_key = compile_key(f.src_path, compile_args)
+    deps = _read_deps(deps_path)
+    if (deps is not None and os.path.isfile(output_path) and
+            _read_cache(cache_path).get(f.name) == dependency_key(src_key, deps)):
+        f.exec_path = output_path
+        return True, True
+    deps = cache.get_deps(src_key) if cache else None
+    if cache and deps is None:
+        # Never compiled before, so the binary can't be in the store.
+        cache.count_miss()
+    if deps is not None:
+        key = dependency_key(src_key, deps)
+        if cache.get(key, output_path):
+            f.exec_path = output_path
+            _write_deps(deps_path, deps)
+            _update_cache(cache_path, f.name, key)
+            return True, True
 
+    depfile_path = f"{output_path}.d"
+    list_deps = bool(compile_args) and bool(
+        _DEPFILE_COMPILER.search(os.path.basename(compile_args[0])))
+    compile_args = [
+        arg.format(exec_path=output_path, src_path=f.src_path)
+        for arg in compile_args]
+    if list_deps:
+        compile_args += ['-MMD', '-MF', depfile_path]
+    try:
+        with tracing.span('compile', file=f.name):
+            subprocess.run(compile_args, check=True, capture_output=True)
+    except subprocess.CalledProcessError as ex:
+        return False, False 
+    deps = []
+    if list_deps:
+        deps = _read_depfile(depfile_path, f.src_path)
+        os.remove(depfile_path)
+    key = dependency_key(src_key, deps)
+    f.exec_path = output_path
+    _write_deps(deps_path, deps)
+    _update_cache(cache_path, f.name, key)
+    if cache:
+        cache.put(key, output_path)
+        cache.put_deps(src_key, deps)
+    return True, False
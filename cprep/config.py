@@ -8,24 +8,42 @@ class ProblemConfig(BaseModel):
     input_file: str 
     output_file: str 
     time_limit_ms: float 
+    memory_limit_mb: Optional[float]
+    output_limit_mb: Optional[float]
+    output_comparison: str
+    float_epsilon: float
 
 
 class GenerationConfig(BaseModel):
     run_deterministic_check: bool 
+    deterministic_check_vary_env: bool
     run_duplicate_check: bool
-    num_workers: int
+    duplicate_check_mode: str
+    num_workers: Optional[int]
     model_solution: str 
     
 
 class EvaluationConfig(BaseModel):
     timeout_multiplier: float 
     tl_close_range: Tuple[float, float]
+    num_workers: Optional[int]
+    verdict_cache_file: str
+
+
+class BenchConfig(BaseModel):
+    num_runs: int
+    num_warmup_runs: int
+    pin_cpu: Optional[int]
+    outlier_threshold: float
+    confidence: float
 
 
 class TestsConfig(BaseModel):
     tests_dir: str 
     input_pattern: str 
     answer_pattern: str 
+    manifest_file: str
+    compression: str
     
 
 class LanguageConfig(BaseModel):
@@ -36,6 +54,8 @@ class LanguageConfig(BaseModel):
     
 class CompilationConfig(BaseModel):
     exec_dir: str
+    cache_dir: Optional[str]
+    cache_size_mb: float
     languages: Dict[str, LanguageConfig]
 
 
@@ -52,11 +72,13 @@ class DiscoveryConfig(BaseModel):
 class Config(BaseModel):
     debug: bool 
     temp_dir: str 
+    scratch_dir: Optional[str]
     discovery: DiscoveryConfig
     compilation: CompilationConfig
     problem: ProblemConfig
     generation: GenerationConfig 
     tests: TestsConfig
     evaluation: EvaluationConfig
+    bench: BenchConfig
     problem: ProblemConfig
    
@@ -1,90 +1,275 @@
 import subprocess
+from . import storage, tracing
 from .base import EvalResult, File
+from .comparison import compare_output
 from .config import ProblemConfig
-from typing import Optional
-import time
+from .execution import ExecResult, execute
+from .manifest import file_digest
+from .sandbox import sandbox, scratch_dir
+from typing import Callable, List, Optional
+import contextlib
+import io
 import os
+import shutil
+import tempfile
+import threading
 
 
-def check_output(input: str, output: str, answer: str,
+CHECKER_TIMEOUT_MS = 30000
+
+_checker_memo = {}
+_checker_memo_lock = threading.Lock()
+
+
+def _in_memory(data):
+    return isinstance(data, (bytes, bytearray))
+
+
+def _open_answer(answer):
+    if _in_memory(answer):
+        return io.BytesIO(answer)
+    return storage.open_test(answer)
+
+
+def run_checker(checker_file: File, input_path: str,
+                output_path: str, answer_path: str):
+    """Runs a testlib-style checker, as `checker <input> <output> <answer>`.
+    Exit code 0 means accepted, 1 (WA) and 2 (PE) mean rejected, and
+    anything else is a checker failure.
+
+    Returns a (verdict, message) pair. Results are memoized on
+    the hashes of the checker and of the three files."""
+    key = (checker_file.exec_digest, file_digest(input_path),
+           file_digest(output_path), file_digest(answer_path))
+    with _checker_memo_lock:
+        if key in _checker_memo:
+            return _checker_memo[key]
+
+    with tempfile.TemporaryFile() as stderr:
+        exec_res = execute(
+            checker_file.run_command() + [input_path, output_path, answer_path],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=stderr,
+            timeout_ms=CHECKER_TIMEOUT_MS)
+        stderr.seek(0)
+        message = stderr.read(1024).decode('utf-8', errors='replace').strip()
+
+    if exec_res.ok:
+        result = ('AC', message or None)
+    elif exec_res.exit_code in [1, 2]:
+        result = ('WA', message or None)
+    else:
+        result = ('FAIL', f"Checker failed ({exec_res.info}): {message}")
+
+    with _checker_memo_lock:
+        _checker_memo[key] = result
+    return result
+
+
+def check_output(input, output, answer, cfg: ProblemConfig,
                  checker_file: Optional[File] = None):
-    assert checker_file is None, "Checkers are not supported."
+    """Checks the output against the answer, with the checker if given,
+    or by comparing them otherwise. The input, output and answer are given
+    either as bytes or as paths to files (the checker needs paths).
+
+    Returns a (verdict, message) pair."""
+    if checker_file:
+        return run_checker(checker_file, input, output, answer)
+
+    with _open_answer(output) as output_stream, \
+            _open_answer(answer) as answer_stream:
+        mismatch = compare_output(
+            output_stream, answer_stream,
+            mode=cfg.output_comparison, epsilon=cfg.float_epsilon)
+    return ('WA', mismatch) if mismatch else ('AC', None)
 
-    output = output.splitlines()
-    answer = answer.splitlines()
-    if len(output) != len(answer):
-        return False
-    for l1, l2 in zip(output, answer):
-        if l1.rstrip() != l2.rstrip():
-            return False
-    return True
+
+def output_limit_bytes(cfg: ProblemConfig):
+    if not cfg.output_limit_mb:
+        return None
+    return int(cfg.output_limit_mb * 1024 * 1024)
+
+
+def output_limit_exceeded(exec_res: ExecResult, cfg: ProblemConfig, paths: List[str]):
+    """Whether the run was killed for its output size, or left output
+    files that reached the limit (writes past it fail with EFBIG, for
+    solutions that ignore SIGXFSZ)."""
+    limit = output_limit_bytes(cfg)
+    return exec_res.output_limit_exceeded or bool(limit) and any(
+        os.path.isfile(path) and os.path.getsize(path) >= limit for path in paths)
 
 
 def run_solution(
-        sol_file: File, input: str, cfg: ProblemConfig,
-        timeout_ms: float = None, run_twice: bool = True):
+        sol_file: File, input, cfg: ProblemConfig,
+        timeout_ms: float = None, run_twice: bool = True,
+        output_handler: Optional[Callable[[str], None]] = None,
+        cpu: Optional[int] = None):
+    """Runs the solution on the given input (bytes, or the path of the
+    input file, which is then fed to the solution without being read).
+    If `output_handler` is given, it is called with the path of the output
+    file of the last run (if successful), instead of reading the output
+    into `EvalResult.output`. The solution is pinned to core `cpu`,
+    if given."""
     if not sol_file.compiled:
         return EvalResult(verdict='CE')
     res = EvalResult(verdict='AC')
 
     n_iters = 2 if run_twice else 1
 
-    time_exec_ms = timeout_ms
-    exec_dir = os.path.dirname(sol_file.exec_path)
-    input_path = os.path.join(exec_dir, cfg.input_file)
-    output_path = os.path.join(exec_dir, cfg.output_file)
+    exec_name = os.path.basename(sol_file.exec_path)
+    file_io = cfg.input_file != 'stdin' or cfg.output_file != 'stdout'
 
     for i in range(n_iters):
         res.verdict = 'AC'
-        tick = time.time()
-
-        with open(input_path, 'wb') as f:
-            f.write(input)
-
-        try:
-            subprocess_result = subprocess.run(
-                [os.path.join('.', os.path.basename(sol_file.exec_path))],
-                cwd=exec_dir,
-                check=True,
-                shell=True,
-                capture_output=True,
-                timeout=(timeout_ms/1000 if timeout_ms else None),
-                input=(input if cfg.input_file == 'stdin' else None))
-            res.stderr = subprocess_result.stderr
-
-            if cfg.output_file == 'stdout':
-                res.output = subprocess_result.stdout
-                with open(output_path, 'wb') as f:
-                    f.write(res.output)
+        res.info = None
+
+        with sandbox(sol_file.exec_path) as run_dir:
+            # Standard streams also go through files inside the
+            # sandbox, named 'stdin' and 'stdout'.
+            input_path = os.path.join(run_dir, cfg.input_file)
+            output_path = os.path.join(run_dir, cfg.output_file)
+            stderr_path = os.path.join(run_dir, 'stderr')
+
+            if _in_memory(input):
+                with open(input_path, 'wb') as f:
+                    f.write(input)
+            elif cfg.input_file == 'stdin':
+                # Standard input is read straight from the test file.
+                input_path = input
+            else:
+                # Copied (in the kernel, unless compressed), so that
+                # the solution can't modify the test.
+                storage.decompress_to(input, input_path)
+
+            with contextlib.ExitStack() as stack:
+                if cfg.input_file != 'stdin':
+                    stdin = subprocess.DEVNULL
+                elif storage.is_compressed(input_path):
+                    # Decompressed on the fly, through a pipe.
+                    stdin, write_fd = os.pipe()
+                    feeder = storage.feed(input_path, write_fd)
+                    stack.callback(feeder.join)
+                    # Closed first, so that the feeder stops if the
+                    # solution didn't read the whole input.
+                    stack.callback(os.close, stdin)
+                else:
+                    stdin = stack.enter_context(open(input_path, 'rb'))
+                stdout = (stack.enter_context(open(output_path, 'wb'))
+                          if cfg.output_file == 'stdout' else subprocess.DEVNULL)
+                stderr = stack.enter_context(open(stderr_path, 'wb'))
+                # Only file I/O needs the sandbox as working directory,
+                # which rules out the fast spawn path.
+                exec_res = execute(
+                    sol_file.run_command(os.path.join(run_dir, exec_name)),
+                    cwd=(run_dir if file_io else None),
+                    stdin=stdin, stdout=stdout, stderr=stderr,
+                    timeout_ms=timeout_ms,
+                    output_limit_bytes=output_limit_bytes(cfg),
+                    cpu=cpu)
+
+            with open(stderr_path, 'rb') as f:
+                res.stderr = f.read()
+            if output_limit_exceeded(exec_res, cfg, [output_path, stderr_path]):
+                res.verdict = 'OLE'
+            elif exec_res.timed_out:
+                res.verdict = 'TLE'
+            elif not exec_res.ok:
+                res.verdict = 'RE'
+                res.info = exec_res.info
+            elif not os.path.isfile(output_path):
+                res.verdict = 'WA'
+                res.info = f"Output file '{cfg.output_file}' not found"
+            elif output_handler:
+                if i == n_iters - 1:
+                    output_handler(output_path)
             else:
                 with open(output_path, 'rb') as f:
                     res.output = f.read()
 
-        except subprocess.CalledProcessError as ex:
-            res.verdict = 'RE'
-            res.info = str(ex)
-        except subprocess.TimeoutExpired as ex:
-            res.verdict = 'TLE'
-
-        tock = time.time()
-        time_exec_ms = (tock - tick) * 1000.
+        res.time_exec_ms = exec_res.time_cpu_ms
+        res.memory_used = exec_res.memory_kb
 
-    res.time_exec_ms = time_exec_ms
     res.input = input
     return res
 
 
+def _keep(data, check_path: str, run_path: Optional[str] = None):
+    """Puts the input or answer next to the output, for the checker.
+    Files are linked, and data already written to `run_path` is moved."""
+    if not _in_memory(data):
+        if storage.is_compressed(data):
+            storage.decompress_to(data, check_path)
+        else:
+            os.symlink(os.path.abspath(data), check_path)
+    elif run_path and os.path.isfile(run_path):
+        os.rename(run_path, check_path)
+    else:
+        with open(check_path, 'wb') as f:
+            f.write(data)
+
+
+def run_for_evaluation(
+        sol_file: File, input, answer, cfg: ProblemConfig,
+        timeout_ms: float = None, checker_file: Optional[File] = None,
+        run_twice: bool = True):
+    """First half of `evaluate_solution`: runs the solution and keeps
+    whatever is needed to check its output in a scratch directory.
+    The input and answer are given as bytes or as paths.
+
+    Returns the result and the scratch directory (None if the run failed),
+    to be passed on to `finish_evaluation`."""
+    check_dir = []
+    def keep_output(output_path: str):
+        check_dir.append(scratch_dir())
+        os.rename(output_path, os.path.join(check_dir[0], 'output'))
+        if checker_file:
+            run_dir = os.path.dirname(output_path)
+            _keep(input, os.path.join(check_dir[0], 'input'),
+                  run_path=os.path.join(run_dir, cfg.input_file))
+            _keep(answer, os.path.join(check_dir[0], 'answer'))
+
+    with tracing.span('run solution', solution=sol_file.name):
+        res = run_solution(
+            sol_file, input, 
+            cfg, timeout_ms=timeout_ms, 
+            run_twice=run_twice, output_handler=keep_output)
+    return res, (check_dir[0] if check_dir else None)
+
+
+def finish_evaluation(
+        res: EvalResult, check_dir: Optional[str],
+        answer, cfg: ProblemConfig,
+        checker_file: Optional[File] = None):
+    """Second half of `evaluate_solution`: checks limits and output."""
+    try:
+        if res.verdict == 'AC' and res.time_exec_ms > cfg.time_limit_ms:
+            res.verdict = 'TLE'
+        # Memory usages below cprep's own are not measured (see `execute`).
+        if (res.verdict == 'AC' and cfg.memory_limit_mb and
+                res.memory_used is not None and
+                res.memory_used > cfg.memory_limit_mb * 1024):
+            res.verdict = 'MLE'
+        if res.verdict == 'AC' and check_dir:
+            with tracing.span('check output'):
+                if checker_file:
+                    res.verdict, res.info = run_checker(
+                        checker_file, os.path.join(check_dir, 'input'),
+                        os.path.join(check_dir, 'output'),
+                        os.path.join(check_dir, 'answer'))
+                else:
+                    res.verdict, res.info = check_output(
+                        None, os.path.join(check_dir, 'output'), answer, cfg)
+    finally:
+        if check_dir:
+            shutil.rmtree(check_dir, ignore_errors=True)
+    return res
+
+
 def evaluate_solution(
-        sol_file: File, input: str, answer: str, cfg: ProblemConfig,
+        sol_file: File, input, answer, cfg: ProblemConfig,
         timeout_ms: float = None, checker_file: Optional[File] = None,
         run_twice: bool = True):
-    res = run_solution(
-        sol_file, input, 
-        cfg, timeout_ms=timeout_ms, 
+    res, check_dir = run_for_evaluation(
+        sol_file, input, answer, cfg,
+        timeout_ms=timeout_ms, checker_file=checker_file,
         run_twice=run_twice)
-    if res.verdict == 'AC' and res.time_exec_ms > cfg.time_limit_ms:
-        res.verdict = 'TLE'
-    if (res.verdict == 'AC' and not check_output(
-            input, res.output, answer, checker_file)):
-        res.verdict = 'WA'
-    return res
+    return finish_evaluation(res, check_dir, answer, cfg, checker_file)
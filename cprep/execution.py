@@ -0,0 +1,317 @@
+from dataclasses import dataclass
+from typing import List, Optional
+import contextlib
+import functools
+import os
+import resource
+import select
+import signal
+import subprocess
+import threading
+import time
+
+from . import tracing
+
+
+PIPE = subprocess.PIPE
+DEVNULL = subprocess.DEVNULL
+
+
+@dataclass
+class ExecResult:
+    exit_code: int
+    timed_out: bool
+    time_cpu_ms: float
+    time_wall_ms: float
+    memory_kb: Optional[int]  # None if it can't be measured (see `execute`)
+    stdout: Optional[bytes] = None
+    output_limit_exceeded: bool = False
+
+    @property
+    def ok(self):
+        return (self.exit_code == 0 and not self.timed_out and
+                not self.output_limit_exceeded)
+
+    @property
+    def info(self):
+        if self.timed_out:
+            return "Killed after timeout"
+        if self.output_limit_exceeded:
+            return "Killed after exceeding the output limit"
+        if self.exit_code < 0:
+            return f"Killed by signal {-self.exit_code}"
+        return f"Exited with code {self.exit_code}"
+
+
+def _exit_code(status: int):
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def _pidfd_open(pid: int):
+    try:
+        return os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def _environ():
+    # Converting os.environ on every spawn costs more than the spawn itself.
+    return dict(os.environb)
+
+
+def _spawn(args: List[str], cwd: Optional[str], fds: dict,
+           env: Optional[dict] = None):
+    """Starts the process and returns its pid, without reaping it.
+    `fds` maps the standard stream numbers to the descriptors to use."""
+    if env is None:
+        env = _environ()
+    if cwd is None:
+        # Fast path: no fork of the Python process and no shell.
+        file_actions = [
+            (os.POSIX_SPAWN_DUP2, fd, target) for target, fd in fds.items()]
+        pid = os.posix_spawnp(
+            args[0], args, env, file_actions=file_actions,
+            setsigdef=(signal.SIGPIPE, signal.SIGXFSZ))
+        return pid, None
+    # posix_spawn can't change the working directory.
+    proc = subprocess.Popen(
+        args, cwd=cwd, env=env, close_fds=False,
+        stdin=fds.get(0), stdout=fds.get(1), stderr=fds.get(2))
+    # The Popen object is kept alive until the process is reaped,
+    # so that subprocess doesn't reap it on its own.
+    return proc.pid, proc
+
+
+def _limit_output(pid: int, limit_bytes: int):
+    """Caps the size of the files written by the process (RLIMIT_FSIZE);
+    writing past it kills the process with SIGXFSZ. Pipes are not capped."""
+    try:
+        resource.prlimit(pid, resource.RLIMIT_FSIZE, (limit_bytes, limit_bytes))
+    except (AttributeError, ProcessLookupError):
+        # Not on Linux, or already gone.
+        pass
+
+
+def _pin(pid: int, cpu: int):
+    """Restricts the process to a single CPU core."""
+    with contextlib.suppress(ProcessLookupError):
+        os.sched_setaffinity(pid, {cpu})
+
+
+def _wait(pid: int, read_fd: Optional[int], timeout_ms: Optional[float],
+          output_limit_bytes: Optional[int] = None):
+    """Waits for the process to finish, reading its output from `read_fd`
+    (if given) and killing it after `timeout_ms` of wall time, or as soon
+    as it outputs more than `output_limit_bytes`."""
+    deadline = time.perf_counter() + timeout_ms / 1000 if timeout_ms else None
+    lock = threading.Lock()
+    state = {'done': False, 'timed_out': False, 'output_limit_exceeded': False}
+
+    def kill(reason: str = 'timed_out'):
+        with lock:
+            if not state['done']:
+                state[reason] = True
+                os.kill(pid, signal.SIGKILL)
+
+    # Process exits are polled through a pidfd, together with the output.
+    # Without pidfd support, timeouts fall back to a timer thread.
+    pidfd = _pidfd_open(pid)
+    timer = None
+    if deadline is not None and pidfd is None:
+        timer = threading.Timer(timeout_ms / 1000, kill)
+        timer.start()
+
+    chunks, num_bytes = [], 0
+    exited = pidfd is None
+    poller = select.poll()
+    if read_fd is not None:
+        poller.register(read_fd, select.POLLIN)
+    if pidfd is not None:
+        poller.register(pidfd, select.POLLIN)
+    try:
+        while read_fd is not None or not exited:
+            timeout = None
+            if deadline is not None and not state['timed_out']:
+                timeout = max(0, int((deadline - time.perf_counter()) * 1000))
+            events = poller.poll(timeout)
+            if not events:
+                kill()
+                continue
+            for fd, _ in events:
+                if fd == pidfd:
+                    exited = True
+                    poller.unregister(pidfd)
+                elif fd == read_fd:
+                    chunk = os.read(read_fd, 1 << 16)
+                    if chunk:
+                        num_bytes += len(chunk)
+                        if output_limit_bytes and num_bytes > output_limit_bytes:
+                            # Whatever comes next is dropped.
+                            kill('output_limit_exceeded')
+                        elif not state['output_limit_exceeded']:
+                            chunks.append(chunk)
+                    else:
+                        poller.unregister(read_fd)
+                        os.close(read_fd)
+                        read_fd = None
+            if exited and pidfd is not None and read_fd is not None:
+                # Drain what's left, without waiting for EOF, as the
+                # pipe may be held open by leftover child processes.
+                os.set_blocking(read_fd, False)
+                with contextlib.suppress(BlockingIOError):
+                    for chunk in iter(lambda: os.read(read_fd, 1 << 16), b''):
+                        num_bytes += len(chunk)
+                        if output_limit_bytes and num_bytes > output_limit_bytes:
+                            state['output_limit_exceeded'] = True
+                            break
+                        chunks.append(chunk)
+                break
+        _, status, rusage = os.wait4(pid, 0)
+    except BaseException:
+        kill()
+        with contextlib.suppress(ChildProcessError):
+            os.waitpid(pid, 0)
+        raise
+    finally:
+        with lock:
+            state['done'] = True
+        if timer:
+            timer.cancel()
+        if pidfd is not None:
+            os.close(pidfd)
+        if read_fd is not None:
+            os.close(read_fd)
+    return (status, rusage, state['timed_out'], state['output_limit_exceeded'],
+            b''.join(chunks))
+
+
+class Process:
+    """A process started by `spawn`, to be waited for exactly once."""
+
+    def __init__(self, pid: int, proc, read_fd: Optional[int], tick: float,
+                 output_limit_bytes: Optional[int] = None, name: str = None,
+                 inherited_kb: int = 0):
+        self.pid = pid
+        self.name = name
+        self._proc = proc
+        self._read_fd = read_fd
+        self._tick = tick
+        self._inherited_kb = inherited_kb
+        self._output_limit_bytes = output_limit_bytes
+        self.result = None
+
+    def kill(self):
+        with contextlib.suppress(ProcessLookupError):
+            os.kill(self.pid, signal.SIGKILL)
+
+    def wait(self, timeout_ms: Optional[float] = None) -> ExecResult:
+        """Waits for the process to finish, killing it after `timeout_ms`
+        of wall time (counted from now)."""
+        assert self.result is None, f"Process {self.pid} already waited for"
+        status, rusage, timed_out, output_limit_exceeded, output = _wait(
+            self.pid, self._read_fd, timeout_ms, self._output_limit_bytes)
+        tock = time.perf_counter()
+        status_signal = os.WTERMSIG(status) if os.WIFSIGNALED(status) else None
+        if self._proc:
+            self._proc.returncode = _exit_code(status)
+        # The peak RSS is at least the one inherited from cprep; anything
+        # up to it can't be told apart from the process's own usage.
+        memory_kb = rusage.ru_maxrss
+        if memory_kb <= self._inherited_kb:
+            memory_kb = None
+
+        self.result = ExecResult(
+            exit_code=_exit_code(status),
+            timed_out=timed_out,
+            time_cpu_ms=(rusage.ru_utime + rusage.ru_stime) * 1000.,
+            time_wall_ms=(tock - self._tick) * 1000.,
+            memory_kb=memory_kb,
+            stdout=output if self._read_fd is not None else None,
+            output_limit_exceeded=(
+                output_limit_exceeded or status_signal == signal.SIGXFSZ))
+        tracing.record_async(
+            self.name, self._tick, tock, cat='process', pid=self.pid,
+            exit_code=self.result.exit_code, cpu_ms=self.result.time_cpu_ms,
+            memory_kb=self.result.memory_kb)
+        return self.result
+
+
+def spawn(
+        args: List[str], cwd: Optional[str] = None,
+        stdin=None, stdout=None, stderr=None,
+        env: Optional[dict] = None,
+        output_limit_bytes: Optional[int] = None,
+        cpu: Optional[int] = None) -> Process:
+    """Starts a process, without waiting for it. See `execute`."""
+    read_fd = None
+    with contextlib.ExitStack() as stack:
+        fds = {}
+        for target, stream in enumerate([stdin, stdout, stderr]):
+            if stream is None:
+                continue
+            if stream == DEVNULL:
+                stream = stack.enter_context(
+                    open(os.devnull, 'rb' if target == 0 else 'wb'))
+            elif stream == PIPE:
+                assert target == 1, "Only stdout can be piped."
+                read_fd, write_fd = os.pipe()
+                # Our end is closed after spawning, so that EOF is
+                # seen when the process exits.
+                stack.callback(os.close, write_fd)
+                stream = write_fd
+            fds[target] = stream if isinstance(stream, int) else stream.fileno()
+
+        tick = time.perf_counter()
+        try:
+            pid, proc = _spawn(args, cwd, fds, env)
+        except BaseException:
+            if read_fd is not None:
+                os.close(read_fd)
+            raise
+    # What the process inherits, now that it has started (see `execute`).
+    inherited_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if output_limit_bytes:
+        _limit_output(pid, output_limit_bytes)
+    if cpu is not None:
+        _pin(pid, cpu)
+    return Process(pid, proc, read_fd, tick, output_limit_bytes,
+                   name=os.path.basename(args[0]), inherited_kb=inherited_kb)
+
+
+def execute(
+        args: List[str], cwd: Optional[str] = None,
+        stdin=None, stdout=None, stderr=None,
+        timeout_ms: Optional[float] = None,
+        env: Optional[dict] = None,
+        output_limit_bytes: Optional[int] = None,
+        cpu: Optional[int] = None):
+    """Runs a process to completion and reports its resource usage.
+
+    Standard streams can be None (inherited), DEVNULL, a file object or
+    a descriptor; stdout can also be PIPE, in which case the output is
+    returned in `ExecResult.stdout`. The process is started directly
+    (without a shell) via `posix_spawn`, unless `cwd` is given.
+
+    CPU time (user + sys) and peak RSS come from `os.wait4`, so they
+    account for the process itself only, not for the time spent by cprep.
+    The process is killed if it runs for more than `timeout_ms` wall time.
+    `env` replaces the environment of cprep, if given.
+
+    With `output_limit_bytes`, the process is killed as soon as it writes
+    more than that into a file or into PIPE (see `ExecResult.
+    output_limit_exceeded`). The file limit is set right after the process
+    starts, so callers should still check the sizes of its output files.
+    With `cpu`, the process is pinned to that core (Linux only).
+
+    The kernel reports a peak RSS of at least the highest RSS of cprep
+    itself so far (the new process starts out from its memory). Peaks up
+    to that are indistinguishable from the inherited one, and are reported
+    as None: only usages above cprep's own can be measured.
+    """
+    return spawn(
+        args, cwd=cwd, stdin=stdin, stdout=stdout, stderr=stderr,
+        env=env, output_limit_bytes=output_limit_bytes,
+        cpu=cpu).wait(timeout_ms)
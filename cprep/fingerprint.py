@@ -0,0 +1,126 @@
+"""
+Fingerprints of test inputs, used to find duplicate tests without
+keeping (or reading back) the tests themselves.
+
+Modes:
+ - 'exact': identical bytes (uses the digest already in the manifest)
+ - 'normalized': identical tokens, ignoring how whitespace is laid out
+ - 'minhash': similar token shingles (estimated Jaccard similarity of at
+   least `NEAR_DUPLICATE_SIMILARITY`), using one-permutation MinHash
+   sketches. Only tests that agree on a whole band of `BAND_SIZE` bins
+   are compared (LSH banding), so few pairs are ever compared.
+"""
+from typing import BinaryIO, Dict, List
+import collections
+import hashlib
+
+from .comparison import tokens
+
+
+MODES = ['exact', 'normalized', 'minhash']
+# Manifest field holding the fingerprint of each mode.
+FIELDS = {'exact': 'digest', 'normalized': 'normalized', 'minhash': 'minhash_bins'}
+SHINGLE_SIZE = 4
+SKETCH_SIZE = 128
+# 16 bands of 8 bins: pairs with a similarity of 0.9 are compared with
+# a probability above 99.9%, pairs with 0.5 with about 6%.
+BAND_SIZE = 8
+NEAR_DUPLICATE_SIMILARITY = 0.9
+
+
+def _normalized_digest(stream: BinaryIO):
+    h = hashlib.sha256()
+    for token in tokens(stream):
+        h.update(token)
+        h.update(b' ')
+    return h.hexdigest()
+
+
+def _hash(data: bytes):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big')
+
+
+def _shingles(stream: BinaryIO):
+    window = collections.deque(maxlen=SHINGLE_SIZE)
+    for token in tokens(stream):
+        window.append(token)
+        if len(window) == SHINGLE_SIZE:
+            yield b' '.join(window)
+    if len(window) < SHINGLE_SIZE:
+        # Short inputs get a single shingle.
+        yield b' '.join(window)
+
+
+def _minhash(stream: BinaryIO):
+    """One-permutation sketch: shingle hashes are split into `SKETCH_SIZE`
+    bins, and each bin keeps its smallest hash. Empty bins borrow from the
+    next non-empty bin (with an offset per step), so that every bin can
+    be compared."""
+    bins = [None] * SKETCH_SIZE
+    for shingle in _shingles(stream):
+        value, bin_idx = divmod(_hash(shingle), SKETCH_SIZE)
+        if bins[bin_idx] is None or value < bins[bin_idx]:
+            bins[bin_idx] = value
+    sketch = []
+    for bin_idx in range(SKETCH_SIZE):
+        for step in range(SKETCH_SIZE):
+            value = bins[(bin_idx + step) % SKETCH_SIZE]
+            if value is not None:
+                sketch.append(value + (step << 64))
+                break
+    return sketch
+
+
+def compute(stream: BinaryIO, mode: str) -> dict:
+    """Returns the fingerprint fields of a test input, to be stored
+    next to its digest in the manifest."""
+    assert mode in MODES, f"Unknown duplicate check mode: '{mode}'"
+    if mode == 'normalized':
+        return {FIELDS[mode]: _normalized_digest(stream)}
+    if mode == 'minhash':
+        return {FIELDS[mode]: _minhash(stream)}
+    return {}
+
+
+def _similarity(sketch1: List[int], sketch2: List[int]):
+    """Estimates the Jaccard similarity of two sketches."""
+    return sum(v1 == v2 for v1, v2 in zip(sketch1, sketch2)) / SKETCH_SIZE
+
+
+def find_duplicates(fingerprints: Dict[int, dict], mode: str) -> List[List[int]]:
+    """Groups test ids with duplicate inputs, given their fingerprints
+    (as computed by `compute`, plus the digest)."""
+    assert mode in MODES, f"Unknown duplicate check mode: '{mode}'"
+    field = FIELDS[mode]
+    if mode != 'minhash':
+        groups = {}
+        for idx, fp in fingerprints.items():
+            groups.setdefault(fp[field], []).append(idx)
+        return [sorted(idxs) for idxs in groups.values() if len(idxs) > 1]
+
+    parent = {idx: idx for idx in fingerprints}
+
+    def find(idx):
+        while parent[idx] != idx:
+            parent[idx] = parent[parent[idx]]
+            idx = parent[idx]
+        return idx
+
+    # Tests landing in the same bucket for some band are compared with
+    # the first test of the bucket, which keeps the work linear even
+    # when many tests look alike.
+    for start in range(0, SKETCH_SIZE, BAND_SIZE):
+        buckets = collections.defaultdict(list)
+        for idx, fp in fingerprints.items():
+            buckets[tuple(fp[field][start:start + BAND_SIZE])].append(idx)
+        for first, *others in buckets.values():
+            for idx in others:
+                if find(idx) != find(first) and _similarity(
+                        fingerprints[first][field],
+                        fingerprints[idx][field]) >= NEAR_DUPLICATE_SIMILARITY:
+                    parent[find(idx)] = find(first)
+
+    groups = {}
+    for idx in fingerprints:
+        groups.setdefault(find(idx), []).append(idx)
+    return [sorted(idxs) for idxs in groups.values() if len(idxs) > 1]
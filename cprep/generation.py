@@ -1,23 +1,81 @@
-from .base import TestCase, File
+from .base import EvalResult, TestCase, File
+from .comparison import normalized_lines
 from .config import TestsConfig, ProblemConfig, GenerationConfig
-from typing import List, Optional
+from .sandbox import remove_scratch_dir, sandbox, scratch_dir
+from typing import BinaryIO, Callable, List, Optional
+import contextlib
 import os
-from . import compilation, evaluation
+from . import evaluation, execution, stress, tracing
 import base64 
 import random
+import select
+import subprocess
 import functools 
-import multiprocessing
+import hashlib
+import itertools
+import threading
+from concurrent import futures
 from .files import Files 
+from .workers import WorkerPool
 import time
 
 
-def _clean_text(text: str):
-    if not text:
-        return text
-    lines = []
-    for line in text.splitlines():
-        lines.append(line.rstrip())
-    return b"".join(line + b'\n' for line in lines)
+CHUNK_SIZE = 1 << 16
+
+
+def discard(res: EvalResult):
+    """Removes the files of a test returned by `_generate_test_case`."""
+    remove_scratch_dir(os.path.dirname(res.input))
+
+
+def _normalize_file(src_path: str, dst_path: str):
+    """Copies a file, removing trailing whitespace from every line."""
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        for chunk in normalized_lines(iter(lambda: src.read(CHUNK_SIZE), b'')):
+            dst.write(chunk)
+
+
+def _write_all(fd: int, chunk: bytes, timeout_ms: float):
+    """Writes the chunk to a non-blocking pipe. Returns False if the reader
+    doesn't make room for it within `timeout_ms`."""
+    deadline = time.perf_counter() + timeout_ms / 1000
+    poller = select.poll()
+    poller.register(fd, select.POLLOUT)
+    view = memoryview(chunk)
+    while view:
+        try:
+            view = view[os.write(fd, view):]
+        except BlockingIOError:
+            remaining_ms = (deadline - time.perf_counter()) * 1000
+            if remaining_ms <= 0 or not poller.poll(remaining_ms):
+                return False
+    return True
+
+
+def _tee(stream: BinaryIO, sinks: List[int], raw: Optional[BinaryIO],
+         stall_timeout_ms: float, on_stall: Callable[[int], None]):
+    """Yields the chunks of the stream, after writing them to the given
+    (non-blocking) pipes and file. Pipes whose reader went away are dropped,
+    and so are those whose reader stops reading for `stall_timeout_ms`,
+    after calling `on_stall` with them. All the pipes are closed at the end."""
+    try:
+        for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+            for fd in list(sinks):
+                try:
+                    if _write_all(fd, chunk, stall_timeout_ms):
+                        continue
+                    on_stall(fd)
+                except BrokenPipeError:
+                    pass
+                os.close(fd)
+                sinks.remove(fd)
+            if raw:
+                raw.write(chunk)
+            yield chunk
+    finally:
+        for fd in sinks:
+            os.close(fd)
+        sinks.clear()
 
 
 def _generate_test_case(
@@ -27,20 +85,151 @@ def _generate_test_case(
         cfg: ProblemConfig,
         args: List[str],
         salt: str = None):
+    """Generates a test. The output of the generator is teed through pipes
+    into the validators and the model solution (unless it reads its input
+    from a file), which all run at the same time.
+
+    The input and answer, with trailing whitespace removed, are written to
+    a scratch directory. Their paths are the `input` and `output` of the
+    returned model solution result, to be removed with `discard`.
+    Returns None if the test is invalid."""
     if salt:
         args = args + [salt]
-    input_text = compilation.run(gen_file, args)
-    for valid_file in valid_files:
-        if not validate_test_case(input_text, valid_file, cfg):
+    test_dir = scratch_dir()
+    try:
+        with tracing.span('generate', args=' '.join(args)):
+            res = _run_generation(
+                gen_file, model_sol_file, valid_files, cfg, args, test_dir)
+    except BaseException:
+        remove_scratch_dir(test_dir)
+        raise
+    if res is None:
+        remove_scratch_dir(test_dir)
+    return res
+
+
+def _run_generation(
+        gen_file: File, model_sol_file: File, valid_files: List[File],
+        cfg: ProblemConfig, args: List[str], test_dir: str):
+    input_path = os.path.join(test_dir, 'input')
+    answer_path = os.path.join(test_dir, 'answer')
+    stream_input = cfg.input_file == 'stdin'
+    file_io = cfg.input_file != 'stdin' or cfg.output_file != 'stdout'
+    exec_name = os.path.basename(model_sol_file.exec_path)
+    procs, sinks = [], []
+    # Pipe -> process reading from it, and the processes that stopped
+    # reading their input (and were killed for it).
+    readers, stalled = {}, []
+
+    def cleanup():
+        # Whatever is still running is not needed anymore.
+        for proc in procs:
+            if proc.result is None:
+                proc.kill()
+                proc.wait()
+        for fd in sinks:
+            os.close(fd)
+
+    def start(command: List[str], stdin=None, **kwargs):
+        proc = execution.spawn(command, stdin=stdin, **kwargs)
+        procs.append(proc)
+        return proc
+
+    def start_piped(command: List[str], **kwargs):
+        read_fd, write_fd = os.pipe()
+        os.set_blocking(write_fd, False)
+        sinks.append(write_fd)
+        try:
+            readers[write_fd] = start(command, stdin=read_fd, **kwargs)
+            return readers[write_fd]
+        finally:
+            os.close(read_fd)
+
+    def on_stall(fd: int):
+        readers[fd].kill()
+        stalled.append(readers[fd])
+
+    with contextlib.ExitStack() as stack:
+        run_dir = stack.enter_context(sandbox(model_sol_file.exec_path))
+        stack.callback(cleanup)
+        model_output_path = os.path.join(run_dir, cfg.output_file)
+        stderr_path = os.path.join(run_dir, 'stderr')
+
+        validators = [
+            start_piped(valid_file.run_command(),
+                        stdout=execution.DEVNULL, stderr=execution.DEVNULL)
+            for valid_file in valid_files]
+
+        model_command = model_sol_file.run_command(os.path.join(run_dir, exec_name))
+        model_kwargs = dict(
+            cwd=(run_dir if file_io else None),
+            stdout=(stack.enter_context(open(model_output_path, 'wb'))
+                    if cfg.output_file == 'stdout' else execution.DEVNULL),
+            stderr=stack.enter_context(open(stderr_path, 'wb')),
+            output_limit_bytes=evaluation.output_limit_bytes(cfg))
+        raw_input = None
+        if stream_input:
+            model = start_piped(model_command, **model_kwargs)
+        else:
+            # The model solution needs the whole input file first.
+            raw_input = stack.enter_context(
+                open(os.path.join(run_dir, cfg.input_file), 'wb'))
+
+        gen_command = gen_file.run_command() + args
+        read_fd, write_fd = os.pipe()
+        try:
+            gen = start(gen_command, stdout=write_fd, stderr=execution.DEVNULL)
+        finally:
+            os.close(write_fd)
+        with tracing.span('stream input'), \
+                open(read_fd, 'rb', buffering=0) as gen_output, \
+                open(input_path, 'wb') as f:
+            # A reader that stops reading would block the generator (and
+            # the others), so it gets as long as the model's timeout.
+            for chunk in normalized_lines(_tee(
+                    gen_output, sinks, raw_input,
+                    cfg.time_limit_ms * 3, on_stall)):
+                f.write(chunk)
+
+        gen_res = gen.wait()
+        if not gen_res.ok:
+            raise subprocess.CalledProcessError(gen_res.exit_code, gen_command)
+        with tracing.span('validate'):
+            valid_results = [valid.wait() for valid in validators]
+        if not all(valid_res.ok for valid_res in valid_results):
             return None
-    model_eval_result = evaluation.run_solution(
-        model_sol_file, input_text, 
-        cfg, timeout_ms=cfg.time_limit_ms*3,
-        run_twice=False)
-    tb = time.time()
-    model_eval_result.input = _clean_text(model_eval_result.input)
-    model_eval_result.output = _clean_text(model_eval_result.output)
-    return model_eval_result
+
+        if not stream_input:
+            raw_input.close()
+            model = start(model_command, stdin=execution.DEVNULL, **model_kwargs)
+        # The time limit starts once the whole input is there.
+        with tracing.span('model solution'):
+            exec_res = model.wait(cfg.time_limit_ms * 3)
+
+        res = EvalResult(verdict='AC', input=input_path)
+        if model in stalled:
+            res.verdict = 'TLE'
+            res.info = "Stopped reading its input"
+        elif evaluation.output_limit_exceeded(
+                exec_res, cfg, [model_output_path, stderr_path]):
+            res.verdict = 'OLE'
+        elif exec_res.timed_out:
+            res.verdict = 'TLE'
+        elif not exec_res.ok:
+            res.verdict = 'RE'
+            res.info = exec_res.info
+        elif not os.path.isfile(model_output_path):
+            res.verdict = 'WA'
+            res.info = f"Output file '{cfg.output_file}' not found"
+        else:
+            with tracing.span('normalize answer'):
+                _normalize_file(model_output_path, answer_path)
+            res.output = answer_path
+        with open(stderr_path, 'rb') as f:
+            res.stderr = f.read()
+        res.time_exec_ms = exec_res.time_cpu_ms
+        res.memory_used = exec_res.memory_kb
+    return res
 
 
 def _evaluate(
@@ -53,101 +242,99 @@ def _evaluate(
         run_twice=False)
 
 
-def _chunk(iterable, k):
-    ret = []
-    for x in iterable:
-        ret.append(x)
-        if len(ret) == k:
-            yield ret 
-            ret.clear()
-    if ret:
-        yield ret 
-
-
-def _generate_stress_goal(
-        generate: callable, 
-        goal: str, n_iters: int, num_workers: int):
-    goal_idx = int(goal[1:])
-    best_value, best_salt = -2e100, None
-    input_text, answer_text = None, None
-
-    salts = [str(i) for i in range(n_iters)]
-
-    pool = multiprocessing.Pool(num_workers)
-    for chunk_salts in _chunk(salts, num_workers):
-        results = pool.map(generate, chunk_salts)
-        for salt, res in zip(chunk_salts, results):
-            if not res:
-                continue 
-            # print(res.input.decode('utf-8'))
-            assert res.verdict == 'AC', "Model solution did not run successfully"
-            stderr_lines = res.stderr.splitlines()
-            assert stderr_lines, "Model solution did not output values on stderr for stress-test optimization"
-            obj_values = list(map(float, stderr_lines[-1].split()))
-            assert len(obj_values) > goal_idx, f"Model solution did not output any value for {goal}"
-            obj_value = obj_values[goal_idx]
-            if best_value < obj_value:
-                best_value = obj_value 
-                input_text = res.input
-                answer_text = res.output
-                best_salt = salt
-    return best_value, best_salt, input_text, answer_text
+def _discard_late(future: futures.Future):
+    if not future.cancelled() and future.exception() is None and future.result():
+        discard(future.result()[0])
 
 
 def _generate_stress_fail(
         generate: callable,
         evaluate: callable,
         n_iters: int, 
-        num_workers: int):
+        pool: WorkerPool):
+    """Looks for a salt on which the target solution fails, preferring
+    WA/RE (and the like) over TLE over the slowest AC.
+
+    Each salt goes through generation, validation, the model solution and
+    the target solution on its own, without waiting for the other salts.
+    The search stops as soon as a failure other than TLE is found.
 
-    best_time, best_verdict, best_salt = 1e9, 'AC', None
-    input_text, answer_text = None, None 
+    Returns the verdict, time and salt of the best test, with the model
+    solution result (whose files are to be removed with `discard`)."""
     def key(verdict):
         return (0 if verdict == 'AC' else 1 if verdict == 'TLE' else 2)
 
-    salts = (str(i) for i in range(n_iters))
-    
-    pool = multiprocessing.Pool(num_workers)
-    first_chunk = True
-
-    for chunk_salts in _chunk(salts, num_workers * 10):
-        # print(chunk_salts)
-        if key(best_verdict) > 1:
-            break
-        model_results = pool.map(generate, chunk_salts)
-        sol_results = pool.starmap(evaluate, [
-            (m_res.input, m_res.output) 
-            for m_res in model_results if m_res])
-        
-        if first_chunk:
-            sol_results = pool.starmap(evaluate, [
-                (m_res.input, m_res.output) 
-                for m_res in model_results if m_res])
-            first_chunk = False 
-
-        for salt, m_res in zip(chunk_salts, model_results):
-            if not m_res:
-                continue
+    found = threading.Event()
+
+    def attempt(salt: str):
+        m_res = generate(salt)
+        if not m_res:
+            return None
+        try:
+            if found.is_set():
+                discard(m_res)
+                return None
             assert m_res.verdict == 'AC', "Model solution did not run successfully"
-            s_res = sol_results.pop(0)
-            # print(s_res.stderr)
-            #print(m_res.stderr, s_res)
-            if (key(best_verdict), best_time < key(s_res.verdict), s_res.time_exec_ms):
-                best_verdict, best_time = s_res.verdict, s_res.time_exec_ms
-                best_salt = salt 
-                input_text, answer_text = m_res.input, m_res.output
-            if key(best_verdict) > 1:
-                break
+            return m_res, evaluate(m_res.input, m_res.output)
+        except BaseException:
+            discard(m_res)
+            raise
 
-    return best_verdict, best_time, best_salt, input_text, answer_text
+    best, best_salt, best_res = None, None, None
+    salts = (str(i) for i in range(n_iters))
+    # Only a few salts are queued at a time, so that cancelling is cheap.
+    max_pending = pool.size * 2
+    pending = {}
+    num_done = 0
+    tick = time.perf_counter()
+    try:
+        while not found.is_set():
+            for salt in itertools.islice(salts, max_pending - len(pending)):
+                pending[pool.submit(attempt, salt)] = salt
+            if not pending:
+                break
+            done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                salt = pending.pop(future)
+                res = future.result()
+                num_done += 1
+                if not res:
+                    continue
+                m_res, s_res = res
+                score = (key(s_res.verdict), s_res.time_exec_ms, -int(salt))
+                if best is None or score > best:
+                    if best_res:
+                        discard(best_res[0])
+                    best, best_salt, best_res = score, salt, res
+                else:
+                    discard(m_res)
+                if key(s_res.verdict) > 1:
+                    found.set()
+    except BaseException:
+        if best_res:
+            discard(best_res[0])
+        raise
+    finally:
+        # Salts already running skip the target solution.
+        found.set()
+        for future in pending:
+            if not future.cancel():
+                future.add_done_callback(_discard_late)
+    salts_per_sec = num_done / max(time.perf_counter() - tick, 1e-6)
 
+    if best is None:
+        return 'AC', 0., None, None, salts_per_sec
+    m_res, s_res = best_res
+    return s_res.verdict, s_res.time_exec_ms, best_salt, m_res, salts_per_sec
 
 
 def generate_test_case(
         tc: TestCase, files: Files, 
         gen_cfg: GenerationConfig, 
-        problem_cfg: ProblemConfig):
-    num_workers = gen_cfg.num_workers
+        problem_cfg: ProblemConfig,
+        pool: WorkerPool):
+    """Generates the input and answer of a test into scratch files
+    (see `TestCase.discard_scratch`). Returns whether it succeeded."""
 
     gen_files = [f for f in files.generators if f.name == tc.generator_name]
     assert len(gen_files) == 1, f"Did not find generator: '{tc.generator_name}'"
@@ -159,10 +346,9 @@ def generate_test_case(
     valid_files = files.validators
     checker_file = files.checker
     
-    tc.input_text, tc.answer_text = None, None 
+    result = None
 
-    # Generate input and answer text from model solution.
-    info = None
+    # Generate input and answer from model solution.
     special = tc.special_args
     generate = functools.partial(
         _generate_test_case, 
@@ -172,16 +358,31 @@ def generate_test_case(
 
     if not special:
         result = generate()
-        if result: 
-            assert result.verdict == 'AC', "Model solution did not run successfully"
-            tc.input_text, tc.answer_text = result.input, result.output
+        if result and result.verdict != 'AC':
+            discard(result)
+            assert False, "Model solution did not run successfully"
 
     elif special[0] == 'stress-goal':
-        [_, goal, n_iters] = special 
-        n_iters = int(n_iters)
-        best_value, best_salt, tc.input_text, tc.answer_text = \
-            _generate_stress_goal(generate, goal, n_iters, num_workers)    
-        tc.info = str(round(best_value))
+        def generate_with(extra_args, salt):
+            return _generate_test_case(
+                gen_file, model_sol_file, valid_files, problem_cfg,
+                tc.args + extra_args, salt)
+
+        search = stress.search_goal(generate_with, special[1:], pool, discard)
+        if search.best:
+            extra_args, salt, result = search.best
+            # Shows how fast the search converged: value@run for every
+            # improvement (the first and last few of them).
+            steps = [f"{round(value)}@{run}" for run, value in search.history]
+            if len(steps) > 4:
+                steps = steps[:1] + ['...'] + steps[-3:]
+            tc.info = (f"{round(search.best_value)}, best at run "
+                       f"{search.last_improvement}/{search.num_runs} "
+                       f"({' > '.join(steps)})")
+            # Recorded like stress-fail salts, so that the test can be
+            # reproduced from its arguments.
+            tc.args.extend(extra_args + [salt])
+            tc.special_args.clear()
 
     elif special[0] == 'stress-fail':
         [_, target, n_iters] = special 
@@ -193,23 +394,213 @@ def generate_test_case(
         
         evaluate = functools.partial(_evaluate, target_sol, checker_file, problem_cfg)
         
-        best_verdict, best_time, best_salt, tc.input_text, tc.answer_text = \
-            _generate_stress_fail(generate, evaluate, n_iters, num_workers)
+        best_verdict, best_time, best_salt, result, salts_per_sec = \
+            _generate_stress_fail(generate, evaluate, n_iters, pool)
         if best_verdict in ['AC', 'TLE']:    
             tc.info = f"#{best_salt}: {best_verdict} ({round(best_time)} ms)"
         else:
             tc.info = f"#{best_salt}: {best_verdict}"
-        tc.args.append(best_salt)
+        tc.info += f", {salts_per_sec:.1f} salts/s"
+        if best_salt is not None:
+            tc.args.append(best_salt)
         tc.special_args.clear()
     
     else:
         raise ValueError(f"Unrecognized special kind: '{special[0]}'")
     
+    tc.discard_scratch()
+    if not result:
+        return False
+    tc.scratch_input_path, tc.scratch_answer_path = result.input, result.output
     return tc.generated
 
 
-def validate_test_case(input_text: str, valid_file: File, cfg: ProblemConfig):
-    assert valid_file.compiled, "Validator is not compiled."
-    result = evaluation.run_solution(
-        valid_file, input_text, cfg, run_twice=False)
-    return result.verdict == 'AC'
+def _is_int(arg: str):
+    return arg.lstrip('-').isdigit()
+
+
+def shrink_test_case(
+        tc: TestCase, files: Files,
+        problem_cfg: ProblemConfig,
+        target: str, n_salts: int,
+        pool: WorkerPool,
+        on_shrink: Optional[callable] = None):
+    """Looks for a smaller test on which the target solution still fails
+    (with a verdict other than TLE), by halving the numeric generator
+    arguments one at a time. Every candidate is tried with up to `n_salts`
+    salts, in parallel. An argument stops shrinking as soon as the failure
+    no longer reproduces.
+
+    Returns the arguments and salt of the smallest failing test, and the
+    size of its input. `on_shrink(args, salt, input_size)` is called on
+    every step."""
+    gen_files = [f for f in files.generators if f.name == tc.generator_name]
+    assert len(gen_files) == 1, f"Did not find generator: '{tc.generator_name}'"
+    [gen_file] = gen_files
+
+    target_sols = [f for f in files.solutions if f.name == target]
+    assert len(target_sols) == 1, f"Target solution: '{target}' not found."
+    [target_sol] = target_sols
+
+    evaluate = functools.partial(
+        _evaluate, target_sol, files.checker, problem_cfg)
+
+    def find_failure(args: List[str]):
+        generate = functools.partial(
+            _generate_test_case, gen_file, files.model_solution,
+            files.validators, problem_cfg, args)
+        verdict, _, salt, m_res, _ = \
+            _generate_stress_fail(generate, evaluate, n_salts, pool)
+        if not m_res:
+            return None
+        # Only the size of the test is needed.
+        input_size = os.path.getsize(m_res.input)
+        discard(m_res)
+        if verdict in ['AC', 'TLE']:
+            return None
+        return salt, input_size
+
+    args = list(tc.args)
+    best = find_failure(args)
+    assert best, (f"Solution '{target}' does not fail on "
+                  f"'{' '.join([tc.generator_name] + args)}' ({n_salts} salts)")
+    if on_shrink:
+        on_shrink(args, best[0], best[1])
+
+    tried = {tuple(args)}
+    shrunk = True
+    while shrunk:
+        shrunk = False
+        for i in range(len(args)):
+            while _is_int(args[i]) and int(args[i]) > 0:
+                candidate = list(args)
+                candidate[i] = str(int(args[i]) // 2)
+                if tuple(candidate) in tried:
+                    break
+                tried.add(tuple(candidate))
+                res = find_failure(candidate)
+                if not res:
+                    break
+                args, best, shrunk = candidate, res, True
+                if on_shrink:
+                    on_shrink(args, best[0], best[1])
+
+    salt, input_size = best
+    return args, salt, input_size
+
+
+# Shifts the clock seen by the generator, if libfaketime is installed.
+_FAKETIME_PATHS = [
+    '/usr/lib/x86_64-linux-gnu/faketime/libfaketime.so.1',
+    '/usr/lib/aarch64-linux-gnu/faketime/libfaketime.so.1',
+    '/usr/lib/faketime/libfaketime.so.1',
+    '/usr/local/lib/faketime/libfaketime.so.1',
+]
+
+
+@functools.lru_cache(maxsize=None)
+def faketime_path():
+    """Path of libfaketime, or None if it is not installed. It can also
+    be given through the FAKETIME_LIB environment variable."""
+    paths = [os.environ.get('FAKETIME_LIB')] + _FAKETIME_PATHS
+    return next((path for path in paths if path and os.path.exists(path)), None)
+
+
+def _varied_environ():
+    """Environment that differs from ours in ways that usually change
+    the seed of careless generators: variables (and so stack addresses),
+    and the current time when possible (see `faketime_path`)."""
+    env = dict(os.environb)
+    env[b'CPREP_DETERMINISM_CHECK'] = os.urandom(random.randint(8, 64)).hex().encode()
+    faketime = faketime_path()
+    if faketime:
+        env[b'LD_PRELOAD'] = faketime.encode()
+        env[b'FAKETIME'] = b'+1d'
+    return env
+
+
+def sample_args(tc: TestCase) -> List[str]:
+    """Returns the arguments of one of the generator runs of a test: for
+    stress tests, with the lower bound of every parameter and salt 0."""
+    args = list(tc.args)
+    special = tc.special_args
+    if special and special[0] == 'stress-goal':
+        _, _, _, params, _ = stress.parse_goal_args(special[1:])
+        args += [str(lo) for lo, _ in params.values()]
+    if special:
+        args.append('0')
+    return args
+
+
+def generator_digest(gen_file: File, args: List[str], vary_environment: bool = False):
+    """Runs only the generator and returns the digest of its output,
+    hashed as it streams in, or None if it fails."""
+    assert gen_file.compiled, f"File '{gen_file.src_path}' not compiled"
+    env = _varied_environ() if vary_environment else None
+    read_fd, write_fd = os.pipe()
+    try:
+        gen = execution.spawn(gen_file.run_command() + args, stdout=write_fd,
+                              stderr=execution.DEVNULL, env=env)
+    except BaseException:
+        os.close(read_fd)
+        raise
+    finally:
+        os.close(write_fd)
+    h = hashlib.sha256()
+    try:
+        with open(read_fd, 'rb', buffering=0) as output:
+            for chunk in iter(lambda: output.read(CHUNK_SIZE), b''):
+                h.update(chunk)
+    except BaseException:
+        gen.kill()
+        gen.wait()
+        raise
+    if not gen.wait().ok:
+        return None
+    return h.hexdigest()
+
+
+def input_key(tc: TestCase, files: Files):
+    """Returns the hashes of everything the input of a test depends on."""
+    gen_files = [f for f in files.generators if f.name == tc.generator_name]
+    assert len(gen_files) == 1, f"Did not find generator: '{tc.generator_name}'"
+    [gen_file] = gen_files
+
+    special = tc.special_args
+    key = {
+        'generator': gen_file.exec_digest,
+        'args': list(tc.args),
+        'special_args': list(special) if special else special,
+        'validators': sorted(f.exec_digest for f in files.validators),
+    }
+    if special:
+        # Stress tests are picked based on how the solutions behave.
+        key['model'] = files.model_solution.exec_digest
+        if special[0] == 'stress-fail':
+            key['target'] = [
+                f.exec_digest for f in files.solutions if f.name == special[1]]
+    return key
+
+
+def generate_answer(
+        tc: TestCase, files: Files,
+        problem_cfg: ProblemConfig):
+    """Regenerates only the answer of a test, by running the
+    model solution on its existing input."""
+    model_sol_file = files.model_solution
+    assert model_sol_file, f"Did not find model solution: '{files.model_sol_path}'"
+    test_dir = scratch_dir()
+    answer_path = os.path.join(test_dir, 'answer')
+    try:
+        result = evaluation.run_solution(
+            model_sol_file, tc.input,
+            problem_cfg, timeout_ms=problem_cfg.time_limit_ms*3,
+            run_twice=False,
+            output_handler=functools.partial(_normalize_file, dst_path=answer_path))
+        assert result.verdict == 'AC', "Model solution did not run successfully"
+    except BaseException:
+        remove_scratch_dir(test_dir)
+        raise
+    tc.discard_scratch()
+    tc.scratch_answer_path = answer_path
+    return tc.generated
@@ -0,0 +1,79 @@
+import hashlib
+import json
+import os
+from typing import Optional
+
+
+def digest(data: bytes):
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_digest(path: str):
+    h = hashlib.sha256()
+    with open(path, 'rb') as stream:
+        for chunk in iter(lambda: stream.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class Manifest:
+    """Records, for each generated test, the hashes of everything
+    that went into generating it, as well as the digests of the
+    resulting files."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, 'r') as stream:
+                self.entries = json.load(stream)
+
+    def get(self, idx: int):
+        return self.entries.get(str(idx))
+
+    def set(self, idx: int, entry: Optional[dict]):
+        if entry is None:
+            self.entries.pop(str(idx), None)
+        else:
+            self.entries[str(idx)] = entry
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as stream:
+            json.dump(self.entries, stream, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def file_entry(path: str, data: Optional[bytes] = None):
+        """Fingerprint of a test file. The digest is computed from `data`
+        when given, to avoid reading the file back."""
+        stat = os.stat(path)
+        return {
+            'digest': digest(data) if data is not None else file_digest(path),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+        }
+
+    @staticmethod
+    def cached_digest(path: str, entry: Optional[dict]):
+        """Digest of the file, taken from its fingerprint if the file
+        didn't change since (by size and mtime)."""
+        if entry:
+            stat = os.stat(path)
+            if (stat.st_size, stat.st_mtime_ns) == (entry['size'], entry['mtime_ns']):
+                return entry['digest']
+        return file_digest(path)
+
+    @staticmethod
+    def file_unchanged(path: str, entry: Optional[dict]):
+        """Checks whether the file still matches its fingerprint.
+        Files with unchanged size and mtime are not re-hashed."""
+        if not entry or not os.path.isfile(path):
+            return False
+        stat = os.stat(path)
+        if stat.st_size != entry['size']:
+            return False
+        if stat.st_mtime_ns == entry['mtime_ns']:
+            return True
+        return file_digest(path) == entry['digest']
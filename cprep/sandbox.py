@@ -0,0 +1,75 @@
+import contextlib
+import os
+import shutil
+import tempfile
+from typing import Optional
+
+
+SHM_DIR = '/dev/shm'
+# Below this much free space, /dev/shm (often only 64 MB in containers)
+# is not used, as large tests and outputs would not fit.
+SHM_MIN_FREE_MB = 1024
+
+_root = None  # Set by `set_scratch_root`.
+
+
+def set_scratch_root(path: Optional[str]):
+    """Puts all the scratch directories under `path`. None picks /dev/shm
+    while it has room, and the system temp directory otherwise."""
+    global _root
+    if path:
+        os.makedirs(path, exist_ok=True)
+    _root = path
+
+
+def _free_mb(path: str):
+    stat = os.statvfs(path)
+    return stat.f_bavail * stat.f_frsize / (1024 * 1024)
+
+
+def _scratch_root():
+    if _root:
+        return _root
+    # Prefer a memory-backed filesystem, so that file I/O doesn't hit the
+    # disk, as long as it has room. Checked every time, as it fills up.
+    if (os.path.isdir(SHM_DIR) and os.access(SHM_DIR, os.W_OK) and
+            _free_mb(SHM_DIR) >= SHM_MIN_FREE_MB):
+        return SHM_DIR
+    return tempfile.gettempdir()
+
+
+def _link(src_path: str, dst_path: str):
+    src_path = os.path.abspath(src_path)
+    try:
+        os.link(src_path, dst_path)
+        return
+    except OSError:
+        pass
+    try:
+        os.symlink(src_path, dst_path)
+        return
+    except OSError:
+        pass
+    shutil.copy2(src_path, dst_path)
+
+
+def scratch_dir():
+    """Creates an empty scratch directory, on the same filesystem as
+    the sandboxes. It is up to the caller to remove it."""
+    return tempfile.mkdtemp(prefix='cprep-', dir=_scratch_root())
+
+
+def remove_scratch_dir(path: str):
+    shutil.rmtree(path, ignore_errors=True)
+
+
+@contextlib.contextmanager
+def sandbox(exec_path: str):
+    """Creates an isolated scratch directory for a single run, with
+    the executable linked inside. The directory is removed afterwards."""
+    run_dir = scratch_dir()
+    try:
+        _link(exec_path, os.path.join(run_dir, os.path.basename(exec_path)))
+        yield run_dir
+    finally:
+        remove_scratch_dir(run_dir)
@@ -0,0 +1,113 @@
+"""
+On-disk format of the tests: plain files, or compressed with gzip or
+zstd (which needs the `zstandard` package). The format of a test file is
+given by its extension, and tests are always read as a stream.
+"""
+import gzip
+import os
+import shutil
+import threading
+from typing import BinaryIO
+
+
+COMPRESSIONS = {
+    'none': '',
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+CHUNK_SIZE = 1 << 20
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        assert False, "Compression 'zstd' needs the 'zstandard' package (pip install zstandard)"
+    return zstandard
+
+
+def test_path(path: str, compression: str):
+    """Path of a test file, stored with the given compression."""
+    assert compression in COMPRESSIONS, \
+        f"Unknown compression: '{compression}' (one of: {', '.join(COMPRESSIONS)})"
+    return path + COMPRESSIONS[compression]
+
+
+def _extension(path: str):
+    for ext in COMPRESSIONS.values():
+        if ext and path.endswith(ext):
+            return ext
+    return ''
+
+
+def is_compressed(path: str):
+    return bool(_extension(path))
+
+
+def plain_path(path: str):
+    """Path of a test file, without the compression extension."""
+    return path[:len(path) - len(_extension(path))]
+
+
+def open_test(path: str) -> BinaryIO:
+    """Opens a test file for reading, decompressing on the fly."""
+    if path.endswith(COMPRESSIONS['gzip']):
+        return gzip.open(path, 'rb')
+    if path.endswith(COMPRESSIONS['zstd']):
+        stream = open(path, 'rb')
+        return _zstandard().ZstdDecompressor().stream_reader(
+            stream, closefd=True)
+    return open(path, 'rb')
+
+
+def store_test(src_path: str, path: str):
+    """Stores a plain file as a test file, compressing it (as a stream)
+    according to the extension of `path`. Files in other formats for the
+    same test are removed."""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    if path.endswith(COMPRESSIONS['gzip']):
+        with open(src_path, 'rb') as src, open(tmp_path, 'wb') as f:
+            # No timestamp, so that equal tests have equal digests.
+            with gzip.GzipFile(fileobj=f, mode='wb', mtime=0) as gz:
+                shutil.copyfileobj(src, gz, CHUNK_SIZE)
+    elif path.endswith(COMPRESSIONS['zstd']):
+        with open(src_path, 'rb') as src, open(tmp_path, 'wb') as f:
+            _zstandard().ZstdCompressor().copy_stream(src, f)
+    else:
+        shutil.copyfile(src_path, tmp_path)
+    os.replace(tmp_path, path)
+
+    base_path = plain_path(path)
+    for ext in COMPRESSIONS.values():
+        if base_path + ext != path and os.path.isfile(base_path + ext):
+            os.remove(base_path + ext)
+
+
+def decompress_to(path: str, dst_path: str):
+    """Writes the plain content of a test file to `dst_path`."""
+    if not is_compressed(path):
+        shutil.copyfile(path, dst_path)
+        return
+    with open_test(path) as src, open(dst_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+
+def feed(path: str, write_fd: int):
+    """Starts a thread writing the plain content of a test file into
+    `write_fd` (the write end of a pipe), which is closed at the end or
+    when the reader goes away. Returns the thread."""
+    def run():
+        try:
+            with open_test(path) as src:
+                for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                    view = memoryview(chunk)
+                    while view:
+                        view = view[os.write(write_fd, view):]
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            os.close(write_fd)
+
+    thread = threading.Thread(target=run, name='cprep-feed', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,263 @@
+"""
+Search strategies for `#! stress-goal` tests:
+
+    ./gen 100 #! stress-goal @0 10000 [strategy] [name=lo..hi ...] [option=value ...]
+
+The model solution prints objective values on the last line of its stderr,
+and the test maximizing the value `@k` is kept. The number after the goal
+is the budget, in model solution runs. Parameters `name=lo..hi` are extra
+integer arguments passed to the generator (before the salt), which some
+strategies search over.
+
+Strategies:
+ - scan (default): salts 0, 1, ..., budget - 1
+ - restarts: random parameters and salts; stops after `patience` runs
+   without improvement
+ - halving: successive halving over `arms` random parameter settings,
+   with twice the runs for the better half of the settings every round
+ - hill: hill-climbing over the parameters, restarting from a random
+   point on local maxima; every point is scored by `samples` salts
+"""
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+import math
+import random
+
+from .workers import WorkerPool
+
+
+STRATEGIES = {}
+
+
+def strategy(name: str):
+    def register(fn: Callable):
+        STRATEGIES[name] = fn
+        return fn
+    return register
+
+
+class GoalSearch:
+    """Keeps track of the budget and of the best test found so far.
+    Strategies submit batches of (extra args, salt) candidates.
+    Tests that are not the best are passed to `discard` right away."""
+
+    def __init__(self, generate: Callable, goal_idx: int, budget: int,
+                 pool: WorkerPool, discard: Callable):
+        self.generate = generate
+        self.goal_idx = goal_idx
+        self.budget = budget
+        self.pool = pool
+        self.discard = discard
+        self.num_runs = 0
+        self.best_value = None
+        self.best = None     # (extra args, salt, model solution result)
+        self.history = []    # (run, value) for every improvement
+
+    @property
+    def remaining(self):
+        return self.budget - self.num_runs
+
+    @property
+    def last_improvement(self):
+        return self.history[-1][0] if self.history else 0
+
+    def _run(self, extra_args: List[str], salt: str):
+        res = self.generate(extra_args, salt)
+        if not res:
+            return None
+        try:
+            assert res.verdict == 'AC', "Model solution did not run successfully"
+            stderr_lines = res.stderr.splitlines()
+            assert stderr_lines, "Model solution did not output values on stderr for stress-test optimization"
+            obj_values = list(map(float, stderr_lines[-1].split()))
+            assert len(obj_values) > self.goal_idx, f"Model solution did not output any value for @{self.goal_idx}"
+        except BaseException:
+            self.discard(res)
+            raise
+        return obj_values[self.goal_idx], res
+
+    def _discard_late(self, future: Future):
+        if not future.cancelled() and future.exception() is None and future.result():
+            self.discard(future.result()[1])
+
+    def evaluate(self, candidates: List[Tuple[List[str], str]]):
+        """Runs the candidates that fit in the remaining budget. Returns
+        their objective values (None for invalid tests), in order."""
+        candidates = candidates[:max(0, self.remaining)]
+        pending = [self.pool.submit(self._run, *candidate) for candidate in candidates]
+        values = []
+        try:
+            for idx, (extra_args, salt) in enumerate(candidates):
+                out = pending[idx].result()
+                pending[idx] = None
+                self.num_runs += 1
+                if out is None:
+                    values.append(None)
+                    continue
+                value, res = out
+                if self.best_value is None or value > self.best_value:
+                    if self.best:
+                        self.discard(self.best[2])
+                    self.best_value = value
+                    self.best = (extra_args, salt, res)
+                    self.history.append((self.num_runs, value))
+                else:
+                    self.discard(res)
+                values.append(value)
+        except BaseException:
+            # The tests still being generated are not needed anymore.
+            for future in pending:
+                if future and not future.cancel():
+                    future.add_done_callback(self._discard_late)
+            raise
+        return values
+
+
+def parse_goal_args(special_args: List[str]):
+    """Parses `@k budget [strategy] [params] [options]`."""
+    assert len(special_args) >= 2, \
+        "Usage: #! stress-goal @k budget [strategy] [name=lo..hi ...] [option=value ...]"
+    goal, budget, rest = special_args[0], special_args[1], special_args[2:]
+    assert goal.startswith('@'), f"Bad stress goal: '{goal}' (expected '@k')"
+    name = 'scan'
+    if rest and '=' not in rest[0]:
+        name, rest = rest[0], rest[1:]
+    assert name in STRATEGIES, \
+        f"Unknown stress-goal strategy: '{name}' (one of: {', '.join(STRATEGIES)})"
+    params, options = {}, {}
+    for arg in rest:
+        assert '=' in arg, f"Bad stress-goal argument: '{arg}'"
+        key, value = arg.split('=', 1)
+        if '..' in value:
+            lo, hi = map(int, value.split('..'))
+            assert lo <= hi, f"Empty range for parameter '{key}'"
+            params[key] = (lo, hi)
+        else:
+            options[key] = int(value)
+    return int(goal[1:]), int(budget), name, params, options
+
+
+def _batch_size(search: GoalSearch):
+    return search.pool.size * 4
+
+
+def _random_salt(rng: random.Random):
+    return str(rng.randrange(1 << 30))
+
+
+def _random_point(params: Dict[str, Tuple[int, int]], rng: random.Random):
+    return [rng.randint(lo, hi) for lo, hi in params.values()]
+
+
+def _args(point: List[int]):
+    return [str(x) for x in point]
+
+
+@strategy('scan')
+def _scan(search: GoalSearch, params, options, rng):
+    assert not params, "Strategy 'scan' does not take parameters"
+    for start in range(0, search.budget, _batch_size(search)):
+        stop = min(start + _batch_size(search), search.budget)
+        search.evaluate([([], str(salt)) for salt in range(start, stop)])
+
+
+@strategy('restarts')
+def _restarts(search: GoalSearch, params, options, rng):
+    patience = options.get('patience', max(100, search.budget // 10))
+    while search.remaining > 0:
+        search.evaluate([
+            (_args(_random_point(params, rng)), _random_salt(rng))
+            for _ in range(_batch_size(search))])
+        if search.num_runs - search.last_improvement >= patience:
+            break
+
+
+@strategy('halving')
+def _halving(search: GoalSearch, params, options, rng):
+    assert params, "Strategy 'halving' needs parameters (name=lo..hi)"
+    num_arms = options.get('arms', 16)
+    arms = {tuple(_random_point(params, rng)) for _ in range(num_arms)}
+    arms = sorted(arms)
+    num_rounds = math.ceil(math.log2(len(arms))) + 1
+    scores = {arm: None for arm in arms}
+    for round_idx in range(num_rounds):
+        last_round = round_idx == num_rounds - 1
+        runs_per_arm = max(1, (search.remaining if last_round else
+                               search.budget // num_rounds) // len(arms))
+        candidates = [(arm, _random_salt(rng))
+                      for arm in arms for _ in range(runs_per_arm)]
+        values = search.evaluate(
+            [(_args(arm), salt) for arm, salt in candidates])
+        for (arm, _), value in zip(candidates, values):
+            if value is not None and (scores[arm] is None or value > scores[arm]):
+                scores[arm] = value
+        if search.remaining <= 0:
+            break
+        arms.sort(key=lambda arm: -math.inf if scores[arm] is None else scores[arm],
+                  reverse=True)
+        arms = arms[:math.ceil(len(arms) / 2)]
+
+
+@strategy('hill')
+def _hill(search: GoalSearch, params, options, rng):
+    assert params, "Strategy 'hill' needs parameters (name=lo..hi)"
+    samples = options.get('samples', 1)
+    bounds = list(params.values())
+
+    def score(points: List[List[int]]) -> List[Optional[float]]:
+        candidates = [(point, _random_salt(rng))
+                      for point in points for _ in range(samples)]
+        values = search.evaluate(
+            [(_args(point), salt) for point, salt in candidates])
+        scores = [None] * len(points)
+        for idx, value in enumerate(values):
+            idx //= samples
+            if value is not None and (scores[idx] is None or value > scores[idx]):
+                scores[idx] = value
+        return scores
+
+    while search.remaining > 0:
+        # Random restart.
+        point = _random_point(params, rng)
+        [value] = score([point])
+        steps = [max(1, (hi - lo) // 4) for lo, hi in bounds]
+        while search.remaining > 0:
+            neighbors = []
+            for i, (lo, hi) in enumerate(bounds):
+                for delta in (steps[i], -steps[i]):
+                    neighbor = list(point)
+                    neighbor[i] = min(hi, max(lo, point[i] + delta))
+                    if neighbor != point and neighbor not in neighbors:
+                        neighbors.append(neighbor)
+            if not neighbors:
+                break
+            scores = score(neighbors)
+            best_idx = max(
+                range(len(neighbors)),
+                key=lambda i: -math.inf if scores[i] is None else scores[i])
+            if scores[best_idx] is not None and (
+                    value is None or scores[best_idx] > value):
+                point, value = neighbors[best_idx], scores[best_idx]
+            elif all(step == 1 for step in steps):
+                # Local maximum.
+                break
+            else:
+                steps = [max(1, step // 2) for step in steps]
+
+
+def search_goal(generate: Callable, special_args: List[str], pool: WorkerPool,
+                discard: Callable):
+    """Runs the strategy given in the `#! stress-goal` arguments.
+    `generate(extra_args, salt)` generates a test and runs the model
+    solution on it; `discard(res)` removes a generated test. Only the
+    best test is kept."""
+    goal_idx, budget, name, params, options = parse_goal_args(special_args)
+    search = GoalSearch(generate, goal_idx, budget, pool, discard)
+    try:
+        # Seeded, so that the search is reproducible.
+        STRATEGIES[name](search, params, options, random.Random(0))
+    except BaseException:
+        if search.best:
+            discard(search.best[2])
+        raise
+    return search
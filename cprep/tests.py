@@ -1,6 +1,7 @@
 from typing import List
 import os
 
+from . import storage
 from .base import File, TestCase
 from .config import ProblemConfig, TestsConfig
 from .files import Files
@@ -47,20 +48,15 @@ def load_tests(files: Files, cfg: TestsConfig):
             assert len(gen_files) == 1, f"Bad generator name: '{gen_name}'"
             [gen_file] = gen_files
 
-            # Read input and answer.
-            input_path = os.path.join(tests_dir, input_pattern.format(idx=idx, gen=gen_file.name))
-            answer_path = os.path.join(tests_dir, answer_pattern.format(idx=idx, gen=gen_file.name))
-            input_text, answer_text = None, None
-            if os.path.exists(input_path):
-                with open(input_path, 'rb') as f:
-                    input_text = f.read()
-            if os.path.exists(answer_path):
-                with open(answer_path, 'rb') as f:
-                    answer_text = f.read()
+            # Input and answer are only read when needed.
+            input_path = storage.test_path(os.path.join(
+                tests_dir, input_pattern.format(idx=idx, gen=gen_file.name)), cfg.compression)
+            answer_path = storage.test_path(os.path.join(
+                tests_dir, answer_pattern.format(idx=idx, gen=gen_file.name)), cfg.compression)
 
             test_cases.append(TestCase(
                 args=args, special_args=special, 
-                input_text=input_text, answer_text=answer_text, 
+                input_path=input_path, answer_path=answer_path, 
                 group_idx=group_idx, idx=idx,  
                 generator_name=gen_file.name, info=None,
             ))
@@ -0,0 +1,139 @@
+"""
+Opt-in tracing and profiling of cprep itself.
+
+Tracing records spans (stages, steps of generating a test, solution runs,
+child processes, and waits for a free worker) and saves them in the
+Chrome trace event format, to be opened in chrome://tracing or
+https://ui.perfetto.dev. Spans of a thread nest; child processes and
+waits for a worker get tracks of their own.
+
+Profiling runs cProfile on the main thread and on every worker thread,
+and reports them together.
+
+Both are off by default, and then cost a single check per hook.
+"""
+from typing import Callable, Optional
+import contextlib
+import cProfile
+import functools
+import itertools
+import json
+import os
+import pstats
+import threading
+import time
+
+
+_events = None      # Trace events, when tracing.
+_start = 0.
+_thread_names = {}
+_async_ids = itertools.count()
+_profilers = None   # cProfile profiler of every thread, when profiling.
+_local = threading.local()
+
+
+def enable_tracing():
+    global _events, _start
+    _events = []
+    _start = time.perf_counter()
+
+
+def tracing_enabled():
+    return _events is not None
+
+
+def _us(t: float):
+    return (t - _start) * 1e6
+
+
+def _tid():
+    thread = threading.current_thread()
+    _thread_names[thread.ident] = thread.name
+    return thread.ident
+
+
+def record(name: str, start: float, end: float, cat: str = 'cprep', **args):
+    """Records a span of the current thread, given `perf_counter` times."""
+    if _events is None:
+        return
+    # Appending to a list is atomic, so no lock is needed.
+    _events.append({
+        'name': name, 'cat': cat, 'ph': 'X', 'ts': _us(start),
+        'dur': (end - start) * 1e6, 'pid': os.getpid(), 'tid': _tid(),
+        'args': args})
+
+
+def record_async(name: str, start: float, end: float, cat: str, **args):
+    """Records a span that is not tied to a thread, on a track of its own
+    (grouped by `cat`)."""
+    if _events is None:
+        return
+    span_id = next(_async_ids)
+    common = {'name': name, 'cat': cat, 'id': span_id, 'pid': os.getpid(), 'tid': _tid()}
+    _events.append({**common, 'ph': 'b', 'ts': _us(start), 'args': args})
+    _events.append({**common, 'ph': 'e', 'ts': _us(end)})
+
+
+@contextlib.contextmanager
+def span(name: str, **args):
+    """Records the time spent inside, when tracing."""
+    if _events is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, start, time.perf_counter(), **args)
+
+
+def traced(fn: Callable):
+    """Decorator recording a span for every call of the function."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with span(fn.__name__):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def save(path: str):
+    """Writes the trace, in the Chrome trace event format."""
+    metadata = [
+        {'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid,
+         'args': {'name': name}}
+        for tid, name in _thread_names.items()]
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': metadata + _events,
+                   'displayTimeUnit': 'ms'}, f)
+
+
+def enable_profiling():
+    global _profilers
+    _profilers = []
+
+
+@contextlib.contextmanager
+def profiled():
+    """Profiles the current thread while inside, when profiling."""
+    if _profilers is None or getattr(_local, 'depth', 0):
+        yield
+        return
+    profiler = getattr(_local, 'profiler', None)
+    if profiler is None:
+        profiler = _local.profiler = cProfile.Profile()
+        _profilers.append(profiler)
+    _local.depth = 1
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        _local.depth = 0
+
+
+def profile_stats() -> Optional[pstats.Stats]:
+    """Stats of all the threads, once they are done."""
+    profilers = [p for p in _profilers or [] if p.getstats()]
+    if not profilers:
+        return None
+    return pstats.Stats(*profilers)
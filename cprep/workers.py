@@ -0,0 +1,149 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+import heapq
+import itertools
+import threading
+import time
+
+from . import tracing
+
+
+# Priorities of tasks: lower runs first, in submission order among equals.
+DEFAULT_PRIORITY = 0
+# Continuations (see `WorkerPool.then`) go ahead of new work, so that
+# whatever the first half left behind (e.g. an output to check) is freed
+# as soon as possible.
+CONTINUATION_PRIORITY = -10
+
+
+class WorkerPool:
+    """Pool of worker threads shared by all the stages of a command.
+
+    All the actual work happens in child processes, so threads are enough
+    to keep the cores busy. Tasks should not block on other tasks of the
+    same pool (use `then` to chain them instead), otherwise the pool
+    can deadlock.
+
+    Tasks wait in a priority queue: each slot of the executor runs the
+    most urgent task queued at the time it starts."""
+
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self._executor = ThreadPoolExecutor(
+            self.size, thread_name_prefix='cprep-worker')
+        self._lock = threading.Lock()
+        self._tasks = []  # Heap of queued tasks.
+        self._seq = itertools.count()
+        self._queued = 0
+        self._running = 0
+
+    @property
+    def queue_depth(self):
+        """Number of tasks waiting for a free worker."""
+        return self._queued
+
+    @property
+    def num_running(self):
+        return self._running
+
+    def __repr__(self):
+        return (f"WorkerPool(size={self.size}, running={self._running}, "
+                f"queued={self._queued})")
+
+    def _run_next(self):
+        with self._lock:
+            if not self._tasks:
+                # Cancelled by `shutdown`.
+                return
+            _, _, future, fn, submitted, args, kwargs = heapq.heappop(self._tasks)
+            self._queued -= 1
+            self._running += 1
+        try:
+            if not future.set_running_or_notify_cancel():
+                return
+            # Partials are named after the function they wrap.
+            name = getattr(getattr(fn, 'func', fn), '__qualname__', None) or repr(fn)
+            tracing.record_async(
+                'queued', submitted, time.perf_counter(), cat='pool', task=name)
+            try:
+                with tracing.profiled(), tracing.span(name):
+                    result = fn(*args, **kwargs)
+            except BaseException as ex:
+                future.set_exception(ex)
+            else:
+                future.set_result(result)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        return self.submit_with_priority(DEFAULT_PRIORITY, fn, *args, **kwargs)
+
+    def submit_with_priority(self, priority: int, fn: Callable,
+                             *args, **kwargs) -> Future:
+        future = Future()
+        task = (priority, next(self._seq), future, fn,
+                time.perf_counter(), args, kwargs)
+        with self._lock:
+            heapq.heappush(self._tasks, task)
+            self._queued += 1
+        try:
+            self._executor.submit(self._run_next)
+        except BaseException:
+            with self._lock:
+                if task in self._tasks:
+                    self._tasks.remove(task)
+                    heapq.heapify(self._tasks)
+                    self._queued -= 1
+            raise
+        return future
+
+    def then(self, future: Future, fn: Callable) -> Future:
+        """Returns a future of `fn(*future.result())`, which is submitted
+        to the pool as soon as `future` is done, ahead of other queued
+        tasks, without blocking a worker in the meantime."""
+        chained = Future()
+
+        def copy_result(inner: Future):
+            if inner.cancelled():
+                chained.cancel()
+            elif inner.exception() is not None:
+                chained.set_exception(inner.exception())
+            else:
+                chained.set_result(inner.result())
+
+        def submit(outer: Future):
+            try:
+                inner = self.submit_with_priority(
+                    CONTINUATION_PRIORITY, fn, *outer.result())
+            except BaseException as ex:
+                chained.set_exception(ex)
+                return
+            inner.add_done_callback(copy_result)
+
+        future.add_done_callback(submit)
+        return chained
+
+    def shutdown(self, cancel: bool = False):
+        """Waits for the running tasks to finish. If `cancel` is set,
+        the queued tasks are dropped instead of being run."""
+        if cancel:
+            self._cancel_queued()
+        self._executor.shutdown(wait=True, cancel_futures=cancel)
+        if cancel:
+            # Anything submitted by the tasks that were still running.
+            self._cancel_queued()
+
+    def _cancel_queued(self):
+        with self._lock:
+            tasks, self._tasks = self._tasks, []
+            self._queued = 0
+        for task in tasks:
+            task[2].cancel()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # On errors (or Ctrl-C), don't start anything new.
+        self.shutdown(cancel=exc_type is not None)
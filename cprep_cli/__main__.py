@@ -8,6 +8,7 @@ import shutil
 from pathlib import Path
 
 from . import commands
+from cprep import sandbox, tracing
 from cprep.config import Config
 from . import USER_CONFIG_DIR
 import os
@@ -21,13 +22,22 @@ def parse_args():
     subparsers = parser.add_subparsers(help='commands', dest='cmd')
     subparsers.required = True
 
+    # Options of every command.
+    common_parser = argparse.ArgumentParser(add_help=False)
+    common_parser.add_argument("--trace", metavar="FILE",
+        help="Save a trace of the run to FILE, in the Chrome trace format "
+             "(open it in chrome://tracing or ui.perfetto.dev)")
+    common_parser.add_argument("--profile", action="store_true",
+        help="Profile cprep itself and print its hottest Python functions")
+
     for command_module in [
             commands.runall, commands.create,
-            commands.evaluate, commands.generate,
+            commands.evaluate, commands.bench, commands.generate,
+            commands.shrink, commands.export,
             commands.clean, commands.config]:
         name = command_module.__name__.split('.')[-1]
         subparser = subparsers.add_parser(
-            name, parents=[command_module.parser])
+            name, parents=[command_module.parser, common_parser])
         subparser.set_defaults(
             run=command_module.run,
             command=name)
@@ -92,12 +102,36 @@ def main():
     cfg = load_config(args)
     if cfg.debug:
         print(yaml.dump(cfg.dict()))
+    sandbox.set_scratch_root(cfg.scratch_dir)
+    if args.trace:
+        tracing.enable_tracing()
+    if args.profile:
+        tracing.enable_profiling()
     try:
-        args.run(cfg, args)
+        with tracing.profiled(), tracing.span(args.command):
+            args.run(cfg, args)
     except AssertionError as ex:
         print()
         print(f"{Fore.RED}[E]: {ex}{Fore.RESET}")
         exit(6)
+    except KeyboardInterrupt:
+        print()
+        print(f"{Fore.YELLOW}Interrupted.{Fore.RESET}")
+        exit(130)
+    finally:
+        report_tracing(args)
+
+
+def report_tracing(args):
+    if args.trace:
+        tracing.save(args.trace)
+        print()
+        print(f"Trace saved to '{args.trace}'")
+    stats = tracing.profile_stats() if args.profile else None
+    if stats:
+        print()
+        print("Hottest Python functions (self time, all threads):")
+        stats.sort_stats('tottime').print_stats(25)
 
 
 if __name__ == "__main__":
@@ -1 +1 @@
-from . import clean, config, create, evaluate, generate, runall
\ No newline at end of file
+from . import bench, clean, config, create, evaluate, export, generate, runall, shrink
\ No newline at end of file
@@ -0,0 +1,28 @@
+import argparse
+from .. import pipelines
+
+
+parser = argparse.ArgumentParser(add_help=False)
+parser.add_argument("solutions", nargs="*", help="Solution source files (default: all matching)")
+parser.add_argument("--tests", type=int, nargs="+",
+    help="Ids of the tests to run on (default: all)")
+parser.add_argument("--runs", type=int,
+    help="Timed runs for every (test, solution) pair (default: bench.num_runs)")
+parser.add_argument("--warmup", type=int,
+    help="Untimed runs before those (default: bench.num_warmup_runs)")
+parser.add_argument("--cpu", type=int,
+    help="CPU core to run the solutions on (default: bench.pin_cpu)")
+
+
+def run(cfg, args):
+    files = pipelines.discover_files(cfg, solutions=args.solutions)
+
+    with pipelines.create_worker_pool(cfg) as pool:
+        pipelines.compile_files(files, cfg, pool)
+
+    test_cases = pipelines.load_tests(files, cfg)
+
+    pipelines.benchmark_solutions(
+        files, test_cases, cfg,
+        num_runs=args.runs, num_warmup_runs=args.warmup,
+        cpu=args.cpu, test_idxs=args.tests)
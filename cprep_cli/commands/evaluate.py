@@ -6,17 +6,20 @@ import yaml
 
 parser = argparse.ArgumentParser(add_help=False)
 parser.add_argument("solutions", nargs="*", help="Solution source files (default: all matching)")
+parser.add_argument("--no-cache", action="store_true",
+    help="Rerun all solutions, ignoring cached results")
 
 
 def run(cfg, args):
     
     files = pipelines.discover_files(cfg, solutions=args.solutions)
     
-    pipelines.compile_files(files, cfg)
-    
-    test_cases = pipelines.load_tests(files, cfg)
-    
-    pipelines.compute_evaluation_results(
-        files, test_cases, cfg)
+    with pipelines.create_worker_pool(cfg) as pool:
+        pipelines.compile_files(files, cfg, pool)
+        
+        test_cases = pipelines.load_tests(files, cfg)
+        
+        pipelines.compute_evaluation_results(
+            files, test_cases, cfg, pool, use_cache=not args.no_cache)
 
     
\ No newline at end of file
@@ -0,0 +1,15 @@
+import argparse
+from .. import pipelines
+
+
+parser = argparse.ArgumentParser(add_help=False)
+parser.add_argument("export_dir", nargs="?", default="tests-plain",
+    help="Directory to write the plain tests to (default: tests-plain)")
+
+
+def run(cfg, args):
+    files = pipelines.discover_files(cfg)
+    test_cases = pipelines.load_tests(files, cfg)
+
+    with pipelines.create_worker_pool(cfg) as pool:
+        pipelines.export_tests(test_cases, cfg, pool, args.export_dir)
@@ -7,13 +7,12 @@ import yaml
 parser = argparse.ArgumentParser(add_help=False)
 parser.add_argument("tests", nargs="*", 
     help="Test ids to generate (1-based; default: all)")
+parser.add_argument("--force", action="store_true",
+    help="Regenerate all tests, even if unchanged")
 
 
 def run(cfg, args):
     files = pipelines.discover_files(cfg)
-
-    pipelines.compile_files(files, cfg)
-    
     test_cases = pipelines.load_tests(files, cfg)
     
     # Filter test cases depending on argument.
@@ -30,6 +29,9 @@ def run(cfg, args):
                     continue
         test_cases = new_test_cases
 
-    pipelines.generate_test_cases(test_cases, files, cfg)
+    with pipelines.create_worker_pool(cfg) as pool:
+        pipelines.compile_files(files, cfg, pool)
+        pipelines.generate_test_cases(
+            test_cases, files, cfg, pool, force=args.force)
 
     
\ No newline at end of file
@@ -5,18 +5,29 @@ from .. import pipelines
 
 
 parser = argparse.ArgumentParser(add_help=False)
+parser.add_argument("--force", action="store_true",
+    help="Regenerate all tests, even if unchanged")
+parser.add_argument("--no-cache", action="store_true",
+    help="Rerun all solutions, ignoring cached results")
 
 
 def run(cfg, args):
 
     files = pipelines.discover_files(cfg)
     
-    pipelines.compile_files(files, cfg)
-
-    test_cases = pipelines.load_tests(files, cfg)
-
-    pipelines.generate_test_cases(test_cases, files, cfg)
-    
-    pipelines.compute_evaluation_results(files, test_cases, cfg)
+    with pipelines.create_worker_pool(cfg) as pool:
+        pipelines.compile_files(files, cfg, pool)
+
+        test_cases = pipelines.load_tests(files, cfg)
+
+        # Tests are evaluated as soon as they are generated.
+        evaluation = pipelines.Evaluation(
+            files, cfg, pool, use_cache=not args.no_cache)
+        pipelines.generate_test_cases(
+            test_cases, files, cfg, pool, force=args.force,
+            on_generated=evaluation.add)
+        
+        pipelines.compute_evaluation_results(
+            files, test_cases, cfg, pool, scheduled=evaluation)
 
 
@@ -0,0 +1,25 @@
+import argparse
+from .. import pipelines
+
+
+parser = argparse.ArgumentParser(add_help=False)
+parser.add_argument("test", type=int,
+    help="Id of the failing test to shrink (1-based)")
+parser.add_argument("--solution",
+    help="Failing solution (default: the stress-fail target of the test)")
+parser.add_argument("--salts", type=int,
+    help="Salts to try for every candidate (default: the stress-fail "
+         "iterations of the test, or 100)")
+
+
+def run(cfg, args):
+    files = pipelines.discover_files(cfg)
+
+    with pipelines.create_worker_pool(cfg) as pool:
+        pipelines.compile_files(files, cfg, pool)
+
+        test_cases = pipelines.load_tests(files, cfg)
+
+        pipelines.shrink_test_case(
+            test_cases, files, cfg, pool, args.test,
+            target=args.solution, n_salts=args.salts)
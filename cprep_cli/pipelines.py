@@ -1,17 +1,21 @@
 import subprocess
-from typing import Optional, List
+from typing import Callable, Optional, List
 import time
 from colorama import Style, Fore
 import os
 import functools
-import copy
+import threading
+from concurrent.futures import Future
 
 from .utils import pad
 from . import logger
 
-from cprep import compilation, evaluation, generation, config, tests
+from cprep import bench, compilation, evaluation, fingerprint, generation, config, storage, tests, tracing
 from cprep.base import EvalResult, File, TestCase
+from cprep.cache import BinaryCache, VerdictCache
 from cprep.files import Files
+from cprep.manifest import Manifest, file_digest
+from cprep.workers import DEFAULT_PRIORITY, WorkerPool
 from cprep.config import Config
 import sys
 
@@ -27,11 +31,35 @@ While this is supported, it may cause problems with reproductibility.
 Please make your generator deterministic, by setting the random seed either as constant, or as command argument.
    Example: `int seed = stoi(argv[1]); srand(seed);`"""
 
+GENERATOR_FAILED_WARNING = "\
+Generator '{name}' failed on arguments '{args}', so the determinism \
+check was skipped for it."
+
+NO_FAKETIME_WARNING = "\
+libfaketime not found (set FAKETIME_LIB to its path), so the determinism \
+check can't shift the clock of generators. Rerunning them a second later instead."
+
 NO_VALIDATORS_FOUND_WARNING = "\
 No validators found. It is recommended to \
 have validators, to check generator output."
 
 
+def create_worker_pool(cfg: Config):
+    """Creates the pool shared by all the stages of a command. Solutions
+    run against wall-clock timeouts, so by default there is one worker
+    per core."""
+    num_cores = os.cpu_count() or 1
+    return WorkerPool(max(
+        cfg.generation.num_workers or num_cores,
+        cfg.evaluation.num_workers or num_cores))
+
+
+def _print_pool_stats(pool: WorkerPool, cfg: Config):
+    if cfg.debug:
+        print(f"{Style.DIM}{pool}{Style.RESET_ALL}")
+
+
+@tracing.traced
 def discover_files(cfg: Config, solutions=None):
     patterns = cfg.discovery.patterns
     model_solution = cfg.generation.model_solution
@@ -57,7 +85,8 @@ def discover_files(cfg: Config, solutions=None):
     return files
 
 
-def compile_files(files: Files, cfg: Config):
+@tracing.traced
+def compile_files(files: Files, cfg: Config, pool: WorkerPool):
     output_dir = os.path.join(cfg.temp_dir, cfg.compilation.exec_dir)
     print("Compiling all files...")
     ext_to_lang_config = {
@@ -66,32 +95,173 @@ def compile_files(files: Files, cfg: Config):
         for ext in lang_cfg.exts}
     compile_files = [f for f in files.files if f.ext in ext_to_lang_config]
     pad_len = max(len(f.src_path) for f in compile_files)
+    cache = None
+    if cfg.compilation.cache_dir:
+        cache = BinaryCache(
+            cfg.compilation.cache_dir, cfg.compilation.cache_size_mb)
     for f in compile_files:
+        f.run_args = ext_to_lang_config[f.ext].run.split()
+    # At most one compilation per core, however large the pool is.
+    slots = threading.BoundedSemaphore(os.cpu_count() or 1)
+    def compile_file(f: File):
+        with slots:
+            return compilation.compile(
+                f, compile_args=ext_to_lang_config[f.ext].compile.split(),
+                output_dir=output_dir, cache=cache)
+    futures = [pool.submit(compile_file, f) for f in compile_files]
+    for f, future in zip(compile_files, futures):
         print(f" - {pad(f.src_path, pad_len)} ", end='', flush=True)
-        lang_config = ext_to_lang_config[f.ext]
-        compiled, used_cache = compilation.compile(f,
-                                                   compile_args=lang_config.compile.split(),
-                                                   output_dir=output_dir)
+        compiled, used_cache = future.result()
         line = GREEN_TICK if compiled else RED_CROSS
         if used_cache:
             line += f" {Style.DIM}(cached){Style.RESET_ALL}"
         print(line)
+    if cache:
+        hits, misses = cache.hits, cache.misses
+        stats = cache.flush_stats()
+        cache_size_mb = cache.evict() / (1024 * 1024)
+        print(f"{Style.DIM}Binary cache: {hits} hits, {misses} misses "
+              f"(total: {stats['hits']} hits, {stats['misses']} misses, "
+              f"{cache_size_mb:.1f} MB){Style.RESET_ALL}")
+    _print_pool_stats(pool, cfg)
     print()
 
 
+EVALUATION_PRIORITY = DEFAULT_PRIORITY - 1
+
+
+class Evaluation:
+    """The (test case, solution) matrix of an evaluation, scheduled on the
+    pool one test at a time. This way, `runall` starts evaluating a test
+    as soon as it is generated, while the next ones are generated."""
+
+    def __init__(self, files: Files, cfg: Config, pool: WorkerPool,
+                 use_cache: bool = True):
+        self.files = files
+        self.cfg = cfg
+        self.pool = pool
+        self.use_cache = use_cache
+        self.timeout_ms = cfg.problem.time_limit_ms * cfg.evaluation.timeout_multiplier
+        self.verdict_cache = VerdictCache(os.path.join(
+            cfg.temp_dir, cfg.evaluation.verdict_cache_file))
+        # Test idx -> (cells, cache keys) for each solution, or None.
+        self.cells = {}
+        self._tc_digests = {}
+        self._manifest = None
+
+    @property
+    def _checker_digest(self):
+        checker_file = self.files.checker
+        return checker_file.exec_digest if checker_file else None
+
+    def _cell_key(self, sol: File, tc_digests):
+        if not sol.compiled:
+            return None
+        problem_cfg = self.cfg.problem
+        return VerdictCache.key(
+            sol.exec_digest, *tc_digests,
+            problem_cfg.time_limit_ms, self.timeout_ms, problem_cfg.memory_limit_mb,
+            problem_cfg.output_limit_mb, self._checker_digest,
+            problem_cfg.input_file, problem_cfg.output_file,
+            problem_cfg.output_comparison, problem_cfg.float_epsilon)
+
+    def _finish(self, answer, res: EvalResult, check_dir: Optional[str]):
+        return evaluation.finish_evaluation(
+            res, check_dir, answer, self.cfg.problem, self.files.checker)
+
+    def _schedule(self, sol: File, tc: TestCase, key: Optional[str]):
+        res = self.verdict_cache.get(key) if (self.use_cache and key) else None
+        if res is None:
+            # Outputs are checked in separate tasks, so that checking
+            # overlaps with running the next solutions. Runs go ahead of
+            # the generation of later tests (in `runall`), and checks
+            # ahead of further runs.
+            future = self.pool.submit_with_priority(
+                EVALUATION_PRIORITY,
+                evaluation.run_for_evaluation, sol, tc.input, tc.answer,
+                self.cfg.problem, timeout_ms=self.timeout_ms,
+                checker_file=self.files.checker)
+            return self.pool.then(
+                future, functools.partial(self._finish, tc.answer)), False
+        future = Future()
+        future.set_result(res)
+        return future, True
+
+    def add(self, tc: TestCase, entry: Optional[dict] = None):
+        """Schedules a test for all the solutions, skipping the cells
+        with cached results. Test digests are mostly taken from the
+        manifest `entry` of the test, read from disk if not given."""
+        if not tc.generated:
+            self.cells[tc.idx] = None
+            return
+        if entry is None:
+            if self._manifest is None:
+                self._manifest = Manifest(os.path.join(
+                    self.cfg.tests.tests_dir, self.cfg.tests.manifest_file))
+            entry = self._manifest.get(tc.idx) or {}
+        tc_digests = (Manifest.cached_digest(tc.input, entry.get('input')),
+                      Manifest.cached_digest(tc.answer, entry.get('answer')))
+        self._tc_digests[tc.idx] = tc_digests
+        keys = [self._cell_key(sol, tc_digests) for sol in self.files.solutions]
+        self.cells[tc.idx] = (
+            [self._schedule(sol, tc, key)
+             for sol, key in zip(self.files.solutions, keys)], keys)
+
+    def cache_result(self, tc: TestCase, sol: File, key: str, res: EvalResult):
+        # Close to the time limit, a single run can't tell on which side
+        # it is (just like TLEs, see `VerdictCache.UNCACHED_VERDICTS`).
+        time_limit_ms = self.cfg.problem.time_limit_ms
+        tl_close_range = self.cfg.evaluation.tl_close_range
+        if (res.time_exec_ms is not None and time_limit_ms * tl_close_range[0]
+                < res.time_exec_ms < time_limit_ms * tl_close_range[1]):
+            return
+        self.verdict_cache.set(key, res, {
+            'solution': [sol.name, sol.exec_digest],
+            'tests': list(self._tc_digests[tc.idx]),
+            'checker': self._checker_digest})
+
+    def save_cache(self, prune: bool):
+        """Saves the verdict cache. With `prune`, which needs all the tests
+        to have been added, results of binaries and tests that are gone
+        are dropped first."""
+        if prune:
+            exec_dir = os.path.join(self.cfg.temp_dir, self.cfg.compilation.exec_dir)
+            binary_digests = {
+                f.name: f.exec_digest for f in self.files.files if f.compiled}
+            def binary_digest(name: str):
+                # Solutions left out of this evaluation keep their results
+                # while their binary stays the same.
+                if name not in binary_digests:
+                    path = os.path.join(exec_dir, name)
+                    binary_digests[name] = (
+                        file_digest(path) if os.path.isfile(path) else None)
+                return binary_digests[name]
+            test_digests = {
+                digest for digests in self._tc_digests.values() for digest in digests}
+            self.verdict_cache.prune(lambda deps: (
+                binary_digest(deps['solution'][0]) == deps['solution'][1] and
+                all(digest in test_digests for digest in deps['tests']) and
+                deps['checker'] == self._checker_digest))
+        self.verdict_cache.save()
+
+
+@tracing.traced
 def compute_evaluation_results(
         files: Files,
         test_cases: List[TestCase],
-        cfg: Config):
+        cfg: Config,
+        pool: WorkerPool,
+        use_cache: bool = True,
+        scheduled: Optional[Evaluation] = None):
+    """Evaluates all the solutions on all the tests and prints the
+    results, as they come. Tests already in `scheduled` are not
+    scheduled again."""
     time_limit_ms = cfg.problem.time_limit_ms
-    timeout_multiplier = cfg.evaluation.timeout_multiplier
     tl_close_range = cfg.evaluation.tl_close_range
-    problem_cfg = cfg.problem
 
     solution_files = files.solutions
-    checker_file = files.checker
 
-    col_len = 15
+    col_len = 22
     header_str = ' '.join([' ' + pad('#', 3)] +
                           [pad(f.name, col_len) for f in solution_files])
     table_len = len(header_str)
@@ -100,52 +270,172 @@ def compute_evaluation_results(
     print(header_str)
     print('=' * table_len)
 
-    last_group_idx = 0
-    for tc in test_cases:
-        if last_group_idx != tc.group_idx:
-            print('-' * table_len)
-        last_group_idx = tc.group_idx
+    scheduled = scheduled or Evaluation(files, cfg, pool, use_cache)
+
+    num_cached = 0
+    done = False
+    try:
+        # Schedule the whole (test case, solution) matrix upfront.
+        for tc in test_cases:
+            if tc.idx not in scheduled.cells:
+                scheduled.add(tc)
+
+        last_group_idx = 0
+        for tc in test_cases:
+            tc_cells, tc_keys = scheduled.cells[tc.idx] or (None, None)
+            if last_group_idx != tc.group_idx:
+                print('-' * table_len)
+            last_group_idx = tc.group_idx
+
+            print(' ' + pad(str(tc.idx), 3), end=' ', flush=True)
+
+            # Print results for each solution, in order.
+            for sol_idx in range(len(solution_files)):
+                if not tc_cells:
+                    print(pad(f"{Style.DIM}-{Style.RESET_ALL}",
+                              col_len), end=' ', flush=True)
+                    continue
+                future, cached = tc_cells[sol_idx]
+                res = future.result()
+                if cached:
+                    num_cached += 1
+                elif tc_keys[sol_idx]:
+                    scheduled.cache_result(
+                        tc, solution_files[sol_idx], tc_keys[sol_idx], res)
+                verdict = res.verdict
+                while len(verdict) < 3:
+                    verdict += ' '
+                if (res.verdict in ['TLE', 'AC'] and time_limit_ms
+                        * tl_close_range[0] < res.time_exec_ms < time_limit_ms * tl_close_range[1]):
+                    verdict = Fore.YELLOW + verdict + Fore.RESET
+                elif res.verdict == 'AC':
+                    verdict = Fore.GREEN + verdict + Fore.RESET
+                else:
+                    verdict = Fore.RED + verdict + Fore.RESET
+                cell_text = f"{verdict}"
+                if res.time_exec_ms >= 0:
+                    usage = f"{round(res.time_exec_ms)} ms"
+                    if res.memory_used is not None:
+                        usage += f", {round(res.memory_used / 1024)} MB"
+                    cell_text += f" {Style.DIM}({usage}){Style.RESET_ALL}"
+                if cached:
+                    cell_text += f"{Style.DIM}*{Style.RESET_ALL}"
+                print(pad(cell_text, col_len), end=' ', flush=True)
+            print()
+        done = True
+    finally:
+        scheduled.save_cache(prune=done)
+    print('=' * table_len)
+    if num_cached:
+        print(f"{Style.DIM}* cached result ({num_cached} cells); "
+              f"use --no-cache to rerun{Style.RESET_ALL}")
+    _print_pool_stats(pool, cfg)
+    print()
 
-        print(' ' + pad(str(tc.idx), 3), end=' ', flush=True)
 
-        # Evaluate and print results for each solution.
-        for sol in solution_files:
+@tracing.traced
+def benchmark_solutions(
+        files: Files,
+        test_cases: List[TestCase],
+        cfg: Config,
+        num_runs: Optional[int] = None,
+        num_warmup_runs: Optional[int] = None,
+        cpu: Optional[int] = None,
+        test_idxs: Optional[List[int]] = None):
+    """Benchmarks every solution on every test (or on the given tests),
+    and prints the timings, one test at a time. Runs happen one after the
+    other, as concurrent runs would disturb each other's timings."""
+    bench_cfg = cfg.bench
+    time_limit_ms = cfg.problem.time_limit_ms
+    num_runs = num_runs or bench_cfg.num_runs
+    num_warmup_runs = (bench_cfg.num_warmup_runs if num_warmup_runs is None
+                       else num_warmup_runs)
+    cpu = bench_cfg.pin_cpu if cpu is None else cpu
+    if cpu is not None:
+        assert hasattr(os, 'sched_setaffinity'), "Pinning to a CPU is only supported on Linux."
+        assert cpu in os.sched_getaffinity(0), f"CPU {cpu} is not available."
+    if test_idxs:
+        unknown = set(test_idxs) - {tc.idx for tc in test_cases}
+        assert not unknown, f"Tests not found: {sorted(unknown)}"
+        test_cases = [tc for tc in test_cases if tc.idx in test_idxs]
+
+    run = functools.partial(
+        bench.run_benchmark,
+        cfg=cfg.problem,
+        num_runs=num_runs,
+        num_warmup_runs=num_warmup_runs,
+        timeout_ms=time_limit_ms * cfg.evaluation.timeout_multiplier,
+        outlier_threshold=bench_cfg.outlier_threshold,
+        confidence=bench_cfg.confidence,
+        cpu=cpu)
+
+    print(f"Benchmarking {len(files.solutions)} solutions on {len(test_cases)} tests "
+          f"({num_runs} runs + {num_warmup_runs} warmup each"
+          f"{f', on CPU {cpu}' if cpu is not None else ''})...")
+    ci_header = f"{round(bench_cfg.confidence * 100)}% CI"
+    widths = [4, 11, 11, 11, 10, 20]
+    num_crossing = 0
+    for sol in files.solutions:
+        print()
+        print(f"{Style.BRIGHT}{sol.name}{Style.RESET_ALL}")
+        if not sol.compiled:
+            print(f" {Fore.RED}Not compiled{Fore.RESET}")
+            continue
+        print(' '.join([pad(h, w) for h, w in zip(
+            [' #', 'median', 'min', 'p95', 'stddev', ci_header], widths)] +
+            ['outliers']))
+        slowest = None
+        for tc in test_cases:
+            print(' ' + pad(str(tc.idx), widths[0] - 1), end=' ', flush=True)
             if not tc.generated:
-                print(pad(f"{Style.DIM}-{Style.RESET_ALL}",
-                          col_len), end=' ', flush=True)
+                print(f"{Style.DIM}-{Style.RESET_ALL}")
+                continue
+            res = run(sol, tc.input)
+            if res.verdict != 'AC':
+                print(f"{Fore.RED}{res.verdict}{Fore.RESET}"
+                      f"{f' ({res.info})' if res.info else ''}")
                 continue
-            res = evaluation.evaluate_solution(
-                sol, tc.input_text, tc.answer_text, problem_cfg,
-                timeout_ms=time_limit_ms * timeout_multiplier,
-                checker_file=checker_file)
-            verdict = res.verdict
-            while len(verdict) < 3:
-                verdict += ' '
-            if (res.verdict in ['TLE', 'AC'] and time_limit_ms
-                    * tl_close_range[0] < res.time_exec_ms < time_limit_ms * tl_close_range[1]):
-                verdict = Fore.YELLOW + verdict + Fore.RESET
-            elif res.verdict == 'AC':
-                verdict = Fore.GREEN + verdict + Fore.RESET
+
+            ci = f"[{res.ci[0]:.1f}, {res.ci[1]:.1f}]"
+            if res.crosses(time_limit_ms):
+                ci = Fore.YELLOW + ci + Fore.RESET
+                num_crossing += 1
+            elif res.ci[0] > time_limit_ms:
+                ci = Fore.RED + ci + Fore.RESET
             else:
-                verdict = Fore.RED + verdict + Fore.RESET
-            cell_text = f"{verdict}"
-            if res.time_exec_ms >= 0:
-                cell_text += f" {Style.DIM}({round(res.time_exec_ms)} ms){Style.RESET_ALL}"
-            print(pad(cell_text, col_len), end=' ', flush=True)
-        print()
-    print('=' * table_len)
+                ci = Fore.GREEN + ci + Fore.RESET
+            cells = [f"{res.median:.1f} ms", f"{res.min:.1f} ms",
+                     f"{res.p95:.1f} ms", f"{res.stddev:.1f}", ci]
+            print(' '.join([pad(c, w) for c, w in zip(cells, widths[1:])] +
+                           [str(res.num_outliers)]))
+            if slowest is None or res.median > slowest[1].median:
+                slowest = (tc, res)
+        if slowest:
+            tc, res = slowest
+            print(f"{Style.DIM}Slowest: test {tc.idx}, median {res.median:.1f} ms "
+                  f"({ci_header} {res.ci[0]:.1f}-{res.ci[1]:.1f} ms){Style.RESET_ALL}")
+
+    print()
+    if num_crossing:
+        print(f"{Fore.YELLOW}{num_crossing} results{Fore.RESET} have confidence "
+              f"intervals containing the time limit ({round(time_limit_ms)} ms); "
+              "more runs or a different limit would settle them.")
     print()
 
 
 def _generate_test_cases(
         test_cases: List[TestCase],
         files: Files,
-        cfg: Config):
+        cfg: Config,
+        pool: WorkerPool,
+        force: bool = False,
+        on_generated: Optional[Callable[[TestCase, Optional[dict]], None]] = None):
     gen_cfg = cfg.generation
     problem_cfg = cfg.problem
     tests_dir = cfg.tests.tests_dir
-    input_pattern = cfg.tests.input_pattern
-    answer_pattern = cfg.tests.answer_pattern
+    # Fingerprints for the duplicate check are stored in the manifest.
+    fp_mode = (gen_cfg.duplicate_check_mode
+               if gen_cfg.run_duplicate_check else 'exact')
 
     print(f"Generating {len(test_cases)} test cases...")
     print(
@@ -154,80 +444,189 @@ def _generate_test_cases(
     checker_file = files.checker
     # print(f"Checker: {checker_file.name if checker_file else 'None'}")
 
-    idx = 1
-    # print(" ", end="")
-    last_group_idx = 0
-    for tc in test_cases:
-        if tc.group_idx != last_group_idx:
-            print("| ", end="")
-        last_group_idx = tc.group_idx
+    model_sol_file = files.model_solution
+    assert model_sol_file and model_sol_file.compiled, \
+        f"Model solution '{gen_cfg.model_solution}' not found or not compiled."
+    manifest = Manifest(os.path.join(tests_dir, cfg.tests.manifest_file))
+    num_reused, num_answers = 0, 0
+    os.makedirs(tests_dir, exist_ok=True)
+
+    def generate_one(tc: TestCase, entry: Optional[dict]):
+        """Generates a test and writes it to disk. Returns whether the
+        test is valid, how much of it was reused and its manifest entry."""
+        input_path, answer_path = tc.input_path, tc.answer_path
+
+        # Skip whatever didn't change since the last generation.
+        key = generation.input_key(tc, files)
+        reuse_input = bool(
+            not force and entry and entry['key'] == key and
+            Manifest.file_unchanged(input_path, entry['input']))
+        reuse_answer = bool(
+            reuse_input and entry['model'] == model_sol_file.exec_digest and
+            Manifest.file_unchanged(answer_path, entry['answer']))
+        reuse = 'answer' if reuse_answer else 'input' if reuse_input else None
 
         # Actual generation happens here.
-        valid = generation.generate_test_case(
-            tc, files, gen_cfg, problem_cfg)
-        output = GREEN_TICK if valid else RED_CROSS
-        if valid:
-            if tc.info:
-                output = f"[{output} {tc.info}]"
-            # Write tests to disk.
-            os.makedirs(tests_dir, exist_ok=True)
-            with open(os.path.join(tests_dir, input_pattern.format(
-                    idx=tc.idx, gen=tc.generator_name)), 'wb') as f:
-                f.write(tc.input_text)
-            with open(os.path.join(tests_dir, answer_pattern.format(
-                    idx=tc.idx, gen=tc.generator_name)), 'wb') as f:
-                f.write(tc.answer_text)
+        if reuse_answer:
+            tc.args, tc.special_args = entry['args'], entry['special_args']
+            tc.info = entry['info']
+            valid = tc.generated
+        elif reuse_input:
+            valid = generation.generate_answer(tc, files, problem_cfg)
         else:
-            tc.input_text = tc.answer_text = None
+            valid = generation.generate_test_case(
+                tc, files, gen_cfg, problem_cfg, pool)
+        if not valid:
+            # Stale files would otherwise pass for the test.
+            tc.discard_scratch()
+            for path in [input_path, answer_path]:
+                if os.path.isfile(path):
+                    os.remove(path)
+            return False, reuse, None
+
+        # Move tests from scratch files to the tests directory.
+        def store(scratch_path: str, path: str):
+            storage.store_test(scratch_path, path)
+            # Digests are those of the stored (maybe compressed) files.
+            return Manifest.file_entry(path)
+
+        try:
+            with tracing.span('store test', test=tc.idx):
+                input_entry = (entry['input'] if reuse_input else
+                               store(tc.scratch_input_path, input_path))
+                answer_entry = (entry['answer'] if reuse_answer else
+                                store(tc.scratch_answer_path, answer_path))
+        finally:
+            # From now on, the test is only kept in the tests directory.
+            tc.discard_scratch()
+        if fingerprint.FIELDS[fp_mode] not in input_entry:
+            with storage.open_test(input_path) as f:
+                input_entry = {**input_entry, **fingerprint.compute(f, fp_mode)}
+        return True, reuse, {
+            'key': key,
+            'model': model_sol_file.exec_digest,
+            'args': tc.args,
+            'special_args': tc.special_args,
+            'info': tc.info,
+            'input': input_entry,
+            'answer': answer_entry,
+        }
+
+    # Plain tests are independent, so they are all handed to the pool
+    # right away. Stress tests are run from this thread when their turn
+    # comes (their salts fan out into the same pool), so that no worker
+    # blocks waiting for other tasks.
+    futures = {}
+    for tc in test_cases:
+        if not tc.special_args:
+            futures[tc.idx] = pool.submit(
+                generate_one, tc, manifest.get(tc.idx))
+
+    last_group_idx = 0
+    try:
+        for tc in test_cases:
+            if tc.group_idx != last_group_idx:
+                print("| ", end="")
+            last_group_idx = tc.group_idx
 
-        print(output, end=" ", flush=True)
+            if tc.idx in futures:
+                valid, reuse, entry = futures[tc.idx].result()
+            else:
+                valid, reuse, entry = generate_one(tc, manifest.get(tc.idx))
+            manifest.set(tc.idx, entry)
+            if on_generated:
+                on_generated(tc, entry)
+            num_reused += reuse == 'answer'
+            num_answers += reuse == 'input'
+
+            output = GREEN_TICK if valid else RED_CROSS
+            if valid:
+                if tc.info:
+                    output = f"[{output} {tc.info}]"
+                if reuse == 'answer':
+                    output = f"{Style.DIM}{output}{Style.RESET_ALL}"
+            print(output, end=" ", flush=True)
+    finally:
+        manifest.save()
 
     print()
+    if num_reused or num_answers:
+        print(f"{Style.DIM}Reused {num_reused} unchanged tests, "
+              f"regenerated {num_answers} answers only.{Style.RESET_ALL}")
     print(f"Tests written to '{os.path.join('.', tests_dir, '')}'.")
+    _print_pool_stats(pool, cfg)
     print()
 
     return test_cases
 
 
+@tracing.traced
 def generate_test_cases(
         test_cases: List[TestCase],
         files: Files,
-        cfg: Config):
+        cfg: Config,
+        pool: WorkerPool,
+        force: bool = False,
+        on_generated: Optional[Callable[[TestCase, Optional[dict]], None]] = None):
+    """Generates the tests, in order, and runs the checks on them.
+    `on_generated(tc, manifest_entry)` is called as soon as each test
+    is written."""
     run_deterministic_check = cfg.generation.run_deterministic_check
     run_duplicate_check = cfg.generation.run_duplicate_check
 
-    generate = functools.partial(
-        _generate_test_cases,
-        test_cases, files, cfg)
-
-    tick = time.time()
-    generate()
-    tock = time.time()
+    vary_environment = cfg.generation.deterministic_check_vary_env
+    # Without libfaketime, time-based seeds only change with the real clock.
+    shift_clock = vary_environment and generation.faketime_path() is not None
+    if run_deterministic_check and vary_environment and not shift_clock:
+        logger.warning(NO_FAKETIME_WARNING)
 
+    # The determinism check reruns only the generators, once per generator,
+    # alongside the actual generation.
+    checks = {}
     if run_deterministic_check:
-        time.sleep(max(0.1, 1.1 - (tock - tick)))
-        nd_generators = set()
-        for tc1 in test_cases:
-            if tc1.generator_name in nd_generators:
+        for tc in sorted(test_cases, key=lambda tc: bool(tc.special_args)):
+            if tc.generator_name in checks:
                 continue
-            nd_generators.add(tc1.generator_name)
-            tc2 = copy.deepcopy(tc1)
-            generation.generate_test_case(
-                tc2, files, cfg.generation, cfg.problem)
-            if tc1.input_text != tc2.input_text:
-                logger.warning(NON_DETERMINISTIC_WARNING.format(
-                    name=tc1.generator_name))
+            [gen_file] = [f for f in files.generators
+                          if f.name == tc.generator_name]
+            args = generation.sample_args(tc)
+            checks[tc.generator_name] = (gen_file, args, pool.submit(
+                generation.generator_digest, gen_file, args))
+            if shift_clock:
+                checks[tc.generator_name] += (pool.submit(
+                    generation.generator_digest, gen_file, args, True),)
+
+    tick = time.time()
+    _generate_test_cases(test_cases, files, cfg, pool, force=force,
+                         on_generated=on_generated)
+
+    if not shift_clock and checks:
+        # Time-based seeds only change from one second to the next.
+        time.sleep(max(0., 1.1 - (time.time() - tick)))
+        for name, (gen_file, args, first) in checks.items():
+            checks[name] += (pool.submit(
+                generation.generator_digest, gen_file, args, vary_environment),)
+    for name, (_, args, first, second) in checks.items():
+        if first.result() is None or second.result() is None:
+            logger.warning(GENERATOR_FAILED_WARNING.format(
+                name=name, args=' '.join(args)))
+        elif first.result() != second.result():
+            logger.warning(NON_DETERMINISTIC_WARNING.format(name=name))
 
     if run_duplicate_check:
-        input_to_tcs = {}
+        # Works on the fingerprints in the manifest, not on the tests.
+        mode = cfg.generation.duplicate_check_mode
+        manifest = Manifest(os.path.join(
+            cfg.tests.tests_dir, cfg.tests.manifest_file))
+        fingerprints = {}
         for tc in test_cases:
-            tcs = input_to_tcs.get(tc.input_text, [])
-            tcs.append(tc)
-            input_to_tcs[tc.input_text] = tcs
-        for tcs in input_to_tcs.values():
-            if len(tcs) > 1:
-                logger.warning(f"Found duplicate tests: [{', '.join(str(tc.idx) for tc in tcs)}]. "
-                               "Please fix this by changing arguments or setting different seed values.")
+            entry = manifest.get(tc.idx)
+            if entry:
+                fingerprints[tc.idx] = entry['input']
+        kind = "duplicate" if mode == 'exact' else "near-duplicate"
+        for idxs in fingerprint.find_duplicates(fingerprints, mode):
+            logger.warning(f"Found {kind} tests: [{', '.join(map(str, idxs))}]. "
+                           "Please fix this by changing arguments or setting different seed values.")
 
     if not files.validators:
         logger.warning(NO_VALIDATORS_FOUND_WARNING)
@@ -235,6 +634,83 @@ def generate_test_cases(
     return test_cases
 
 
+@tracing.traced
+def shrink_test_case(
+        test_cases: List[TestCase],
+        files: Files,
+        cfg: Config,
+        pool: WorkerPool,
+        test_idx: int,
+        target: Optional[str] = None,
+        n_salts: Optional[int] = None):
+    tcs = [tc for tc in test_cases if tc.idx == test_idx]
+    assert tcs, f"Test {test_idx} not found."
+    [tc] = tcs
+
+    # Stress-fail tests provide defaults for the target and salts.
+    special = tc.special_args or []
+    if special and special[0] == 'stress-fail':
+        target = target or special[1]
+        n_salts = n_salts or int(special[2])
+    assert target, "Please specify the target solution (--solution)."
+    n_salts = n_salts or 100
+
+    model_sol_file = files.model_solution
+    assert model_sol_file and model_sol_file.compiled, \
+        f"Model solution '{cfg.generation.model_solution}' not found or not compiled."
+
+    print(f"Shrinking test {tc.idx} against {Style.BRIGHT}{target}{Style.RESET_ALL} "
+          f"({n_salts} salts per candidate)...")
+
+    def on_shrink(args, salt, input_size):
+        line = ' '.join([tc.generator_name] + args + [salt])
+        print(f" - {pad(line, 40)} {input_size} bytes", flush=True)
+
+    args, salt, _ = generation.shrink_test_case(
+        tc, files, cfg.problem, target, n_salts, pool, on_shrink=on_shrink)
+
+    print(f"Smallest failing test: {Style.BRIGHT}"
+          f"{' '.join(['./' + tc.generator_name] + args + [salt])}{Style.RESET_ALL}")
+    _print_pool_stats(pool, cfg)
+    print()
+
+
+@tracing.traced
+def export_tests(
+        test_cases: List[TestCase],
+        cfg: Config,
+        pool: WorkerPool,
+        export_dir: str):
+    """Writes the tests as plain (uncompressed) files."""
+    print(f"Exporting {len(test_cases)} tests to "
+          f"'{os.path.join('.', export_dir, '')}'...")
+    os.makedirs(export_dir, exist_ok=True)
+
+    def export(tc: TestCase):
+        if not tc.generated:
+            return False
+        for path in [tc.input_path, tc.answer_path]:
+            storage.decompress_to(path, os.path.join(
+                export_dir, os.path.basename(storage.plain_path(path))))
+        return True
+
+    num_missing = 0
+    last_group_idx = 0
+    for tc, future in [(tc, pool.submit(export, tc)) for tc in test_cases]:
+        if tc.group_idx != last_group_idx:
+            print("| ", end="")
+        last_group_idx = tc.group_idx
+        exported = future.result()
+        num_missing += not exported
+        print(GREEN_TICK if exported else RED_CROSS, end=" ", flush=True)
+    print()
+    if num_missing:
+        logger.warning(f"{num_missing} tests are missing. "
+                       "Please run `cprep generate` first.")
+    print()
+
+
+@tracing.traced
 def load_tests(files: Files, cfg: Config):
     tests_cfg = cfg.tests
     return tests.load_tests(files, tests_cfg)
@@ -16,6 +16,7 @@ setup(
     author_email='bicsi@ymail.com',
     license='GNU General Public License',
     install_requires=['colorama', 'loguru', 'pydantic', 'PyYAML', 'tabulate', 'typing-extensions'],
+    extras_require={'zstd': ['zstandard']},
     packages=['cprep', 'cprep_cli', 'cprep_cli.commands'],
     classifiers=[
         'Development Status :: 1 - Planning',